@@ -1,14 +1,62 @@
 import os
 import sys
 import asyncio
+import functools
+import traceback
+import atexit
+import logging
+import logging.handlers
+import math
+import queue
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, time
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from starlette.websockets import WebSocketState
+from pydantic import BaseModel, ValidationError
 import uvicorn
+import orjson
 from dotenv import load_dotenv
-from neo4j import AsyncGraphDatabase
+from neo4j import AsyncGraphDatabase, READ_ACCESS
+from neo4j.time import Date, DateTime, Duration, Time
 import pandas as pd # Import pandas for potential DataFrame conversion
-from typing import Dict, List, Any # Add typing imports
+from typing import Dict, List, Any, Optional # Add typing imports
+
+# uvloop has no Windows build; winloop is its drop-in port. Installed at import time so
+# uvicorn's spawned reload/worker processes (which import this module first) get it too.
+WINLOOP_INSTALLED = False
+if sys.platform == "win32":
+    try:
+        import winloop
+        winloop.install()
+        WINLOOP_INSTALLED = True
+    except ImportError:
+        pass
+
+# --- Logging --- 
+
+# Log records are put on an in-memory queue; a background listener thread does the
+# actual stream writes, so a slow stdout/pipe never blocks the event loop.
+_log_queue = queue.SimpleQueue()
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_stream_handler, respect_handler_level=True)
+_root_logger = logging.getLogger()
+# Module may be imported twice in one process (__mp_main__ + "main" under uvicorn reload)
+if not any(isinstance(h, logging.handlers.QueueHandler) for h in _root_logger.handlers):
+    _root_logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+logger = logging.getLogger("insight_backend")
+logger.setLevel(logging.INFO)
+logging.getLogger("langchain_arch").setLevel(logging.INFO) # Pipeline stats (e.g. prompt-cache usage)
+_log_listener.start()
+
+def _stop_log_listener():
+    """Flushes and stops the log listener thread (safe to call more than once)."""
+    if _log_listener._thread is not None:
+        _log_listener.stop()
+
+atexit.register(_stop_log_listener)
 
 # --- Setup: Paths and Environment --- 
 
@@ -29,24 +77,43 @@ load_dotenv(dotenv_path=dotenv_path_local, verbose=False, override=False)
 # Validate environment variables ARE SET (critical check)
 # This check works using os.getenv, which checks the actual environment first,
 # then potentially values loaded from .env (if override=False was used).
-required_env_vars = ["OPENAI_API_KEY", "NEO4J_URI", "NEO4J_USERNAME", "NEO4J_PASSWORD"]
-missing_vars = [var for var in required_env_vars if not os.getenv(var)]
-if missing_vars:
-    print(f"ERROR: Missing required environment variables: {', '.join(missing_vars)}. Ensure they are set in the execution environment (e.g., Render service config) or a local .env file.")
-    sys.exit(1) # Exit if critical env vars are missing
+def _load_env(required: List[str], optional: Dict[str, str]) -> Dict[str, str]:
+    """Reads each variable once; exits if any required one is missing, applies defaults to optional ones."""
+    values = {key: os.getenv(key) for key in required}
+    missing_vars = [key for key, value in values.items() if not value]
+    if missing_vars:
+        logger.error("Missing required environment variables: %s. Ensure they are set in the execution environment (e.g., Render service config) or a local .env file.", ', '.join(missing_vars))
+        sys.exit(1) # Exit if critical env vars are missing
+    values.update({key: os.getenv(key, default) for key, default in optional.items()})
+    return values
 
 # These will now correctly use Render's env vars first
-NEO4J_URI = os.getenv("NEO4J_URI")
-NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
-NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+_env = _load_env(
+    required=["OPENAI_API_KEY", "NEO4J_URI", "NEO4J_USERNAME", "NEO4J_PASSWORD"],
+    optional={
+        "NEO4J_DATABASE": "neo4j", # Same default as langchain_arch's Neo4jDatabase
+        "WORKFLOW_CONCURRENCY": "8",
+        "NEO4J_QUERY_CONCURRENCY": "8",
+        "NEO4J_MAX_POOL_SIZE": "100",
+    },
+)
+NEO4J_URI = _env["NEO4J_URI"]
+NEO4J_USERNAME = _env["NEO4J_USERNAME"]
+NEO4J_PASSWORD = _env["NEO4J_PASSWORD"]
+OPENAI_API_KEY = _env["OPENAI_API_KEY"]
+NEO4J_DATABASE = _env["NEO4J_DATABASE"]
+# Concurrency tuning: workflows running at once (all connections), Cypher queries running at
+# once per workflow, and the driver pool that has to serve their product at peak
+WORKFLOW_CONCURRENCY = int(_env["WORKFLOW_CONCURRENCY"])
+QUERY_CONCURRENCY = int(_env["NEO4J_QUERY_CONCURRENCY"])
+NEO4J_MAX_POOL_SIZE = int(_env["NEO4J_MAX_POOL_SIZE"])
 
 # Schema File Path (relative to project root - graphdb/)
 # This uses the correctly calculated project_root path
 SCHEMA_FILE_DEFAULT = "neo4j_schema.md"
 schema_path_abs = os.path.abspath(os.path.join(project_root, SCHEMA_FILE_DEFAULT))
 if not os.path.exists(schema_path_abs):
-    print(f"ERROR: Schema file not found at '{schema_path_abs}'")
+    logger.error("Schema file not found at '%s'", schema_path_abs)
     sys.exit(1)
 
 # --- Application State (Initialization on Startup) --- 
@@ -54,134 +121,498 @@ if not os.path.exists(schema_path_abs):
 # Store shared resources like the driver, router, and LLM instance
 app_state = {
     "neo4j_driver": None,
+    "read_session": None, # Factory for pooled read-only sessions: `async with app_state["read_session"]() as s:`
     "router": None,
-    "llm": None # Add LLM instance to app state
+    "llm": None, # Add LLM instance to app state
+    "schema_text": None, # Schema markdown, read once at startup and shared by all workflows
+    # Caps concurrent query workflows (LLM calls + Neo4j sessions) across all connections
+    "workflow_semaphore": asyncio.Semaphore(WORKFLOW_CONCURRENCY),
+    "components": None, # Components bundle, set once startup has every piece the chat handler needs
 }
 
+@dataclass(frozen=True, slots=True)
+class Components:
+    """Everything the chat handler needs, validated once at startup and read with one lookup per connection."""
+    router: Any
+    read_session: Any
+    llm: Any
+    workflow_semaphore: asyncio.Semaphore
+
 # --- FastAPI App --- 
 
 app = FastAPI(title="Insight Assistant Backend")
 
 # Configure CORS (Cross-Origin Resource Sharing)
 # Allows the Next.js frontend (running on a different port) to communicate with the API
+# FRONTEND_ORIGIN may list several comma-separated origins; explicit lists (no "*") let
+# Starlette precompute its CORS headers and are required when credentials are allowed
+FRONTEND_ORIGINS = [origin.strip() for origin in os.getenv("FRONTEND_ORIGIN", "http://localhost:3000").split(",") if origin.strip()]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"], # Allow your Next.js frontend origin
+    allow_origins=FRONTEND_ORIGINS, # Allow your Next.js frontend origin
     allow_credentials=True,
-    allow_methods=["*"], # Allow all methods (GET, POST, etc.)
-    allow_headers=["*"], # Allow all headers
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["content-type", "authorization"],
 )
 
 # --- Pydantic Models (for request/response validation) ---
 
 class ChatRequest(BaseModel):
     query: str
+    workflow_type: Optional[str] = None # 'insight' / 'optimization' skips classification
+
+def parse_chat_request(raw: str) -> Optional[ChatRequest]:
+    """Accepts either a JSON ChatRequest or a plain-text query (what the frontend sends today).
+
+    Returns None for client control messages such as {"type": "ack", "seq": N}.
+    """
+    if raw.lstrip().startswith("{"):
+        try:
+            payload = orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            payload = None
+        if isinstance(payload, dict):
+            if payload.get("type") == "ack":
+                return None
+            try:
+                return ChatRequest.model_validate(payload)
+            except ValidationError:
+                pass # Not a ChatRequest; treat the whole message as the query text
+    return ChatRequest(query=raw)
+
+class GraphAgentOutput(BaseModel):
+    """Expected shape of GraphGeneratorAgent output; anything else validates to an error."""
+    graph_suggestions: List[Dict[str, Any]] = []
 
 # --- Initialization Logic (Router, Driver, LLM, Agents) --- 
 
 # Import Router and Agents here, after setting sys.path
 try:
-    from langchain_openai import ChatOpenAI # Import LLM
+    from langchain_arch.utils.llm import make_chat_llm, enable_shared_http_async_client, close_shared_http_async_client
     from langchain_arch.chains.router import Router
-    # Import final agents
-    from langchain_arch.agents.insight_generator import InsightGeneratorAgent
-    from langchain_arch.agents.optimization_generator import OptimizationRecommendationGeneratorAgent
-    from langchain_arch.agents.graph_generator import GraphGeneratorAgent # Import the new agent
+    from langchain_arch.utils.neo4j_utils import close_database # Shared sync DB used by the workflows
+    # Import final agents (shared instances via cached factories)
+    from langchain_arch.agents.insight_generator import get_insight_generator_agent
+    from langchain_arch.agents.optimization_generator import get_optimization_recommendation_agent
+    from langchain_arch.agents.graph_generator import get_graph_generator_agent
+    from langchain_arch.utils.serialization import dumps_prompt_data, json_default
 except ImportError as e:
-    print(f"ERROR: Failed to import Router or Agents: {e}. Ensure langchain_arch is in the Python path ({project_root}) and dependencies are installed.")
+    logger.error("Failed to import Router or Agents: %s. Ensure langchain_arch is in the Python path (%s) and dependencies are installed.", e, project_root)
     sys.exit(1)
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize Neo4j Driver, LLM, and LangChain Router on application startup."""
-    print("Initializing Neo4j driver...")
-    neo4j_uri = os.getenv("NEO4J_URI") # Get URI again for logging
-    print(f"Attempting to connect to Neo4j at: {neo4j_uri}") # Log the URI being used
+# Every LLM call runs on uvicorn's one event loop, so all agents can share one HTTP pool
+enable_shared_http_async_client()
+
+def _read_text_file(path: str) -> str:
+    """Reads a UTF-8 text file (run via asyncio.to_thread at startup)."""
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+async def _warm_read_connection():
+    """Runs a trivial read so the session's pooled connection is opened (handshake + auth) now."""
+    async with app_state["read_session"]() as session:
+        result = await session.run("RETURN 1")
+        await result.consume()
+
+async def _init_neo4j_driver():
+    """Creates the Neo4j driver and verifies connectivity (app_state entries stay None on failure)."""
+    logger.info("Initializing Neo4j driver...")
+    neo4j_uri = NEO4J_URI
+    logger.info("Attempting to connect to Neo4j at: %s", neo4j_uri) # Log the URI being used
     try:
+        if NEO4J_MAX_POOL_SIZE < WORKFLOW_CONCURRENCY * QUERY_CONCURRENCY:
+            logger.warning(
+                "NEO4J_MAX_POOL_SIZE=%s is below WORKFLOW_CONCURRENCY x NEO4J_QUERY_CONCURRENCY (%s); "
+                "queries will wait for connections at peak load.",
+                NEO4J_MAX_POOL_SIZE, WORKFLOW_CONCURRENCY * QUERY_CONCURRENCY,
+            )
         app_state["neo4j_driver"] = AsyncGraphDatabase.driver(
             NEO4J_URI, # Use the variable loaded earlier
-            auth=(NEO4J_USERNAME, NEO4J_PASSWORD)
+            auth=(NEO4J_USERNAME, NEO4J_PASSWORD),
+            # Connection pool tuning: bounded concurrency, fail fast when exhausted,
+            # recycle long-lived connections before load balancers drop them
+            max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+            connection_acquisition_timeout=30.0,
+            max_connection_lifetime=3600,
+            keep_alive=True,
+        )
+        # All generated Cypher is read-only; sessions borrow pooled connections from the driver
+        app_state["read_session"] = functools.partial(
+            app_state["neo4j_driver"].session, database=NEO4J_DATABASE, default_access_mode=READ_ACCESS
         )
         # Add a specific timeout to verify_connectivity if desired (e.g., 10 seconds)
         # await asyncio.wait_for(app_state["neo4j_driver"].verify_connectivity(), timeout=10.0)
         await app_state["neo4j_driver"].verify_connectivity() # Verify connection
-        print("Neo4j driver initialized and connection verified successfully.")
+        logger.info("Neo4j driver initialized and connection verified successfully.")
+        try:
+            # Open one pooled connection per query worker up front so the first workflow
+            # doesn't pay routing/handshake/auth round-trips on every concurrent query
+            await asyncio.gather(*(_warm_read_connection() for _ in range(QUERY_CONCURRENCY)))
+            logger.info("Neo4j connection pool warmed (%s connections).", QUERY_CONCURRENCY)
+        except Exception as e:
+            # Not fatal: connections are opened on demand
+            logger.warning("Neo4j connection pool warm-up failed: %s", e)
     except Exception as e:
         # Log the specific exception type and message
-        print(f"FATAL: Failed to initialize or verify Neo4j Driver connection to {neo4j_uri}.")
-        print(f"Error Type: {type(e).__name__}")
-        print(f"Error Details: {e}")
-        # Optionally log traceback for more detail if needed during debugging
-        # import traceback
-        # traceback.print_exc()
+        logger.critical("Failed to initialize or verify Neo4j Driver connection to %s.", neo4j_uri)
+        logger.error("Error Type: %s", type(e).__name__)
+        logger.error("Error Details: %s", e)
         app_state["neo4j_driver"] = None # Ensure driver state is None if failed
+        app_state["read_session"] = None
         # Consider if the app should exit or continue degraded
         # sys.exit(1)
 
-    print("Initializing LLM...")
+async def _init_llm():
+    """Creates the shared LLM client (constructor does no network I/O, but keep it off the loop)."""
+    logger.info("Initializing LLM...")
     try:
         # Initialize the LLM instance (adjust model name and temp as needed)
-        app_state["llm"] = ChatOpenAI(model="gpt-4-turbo", temperature=0, api_key=OPENAI_API_KEY)
-        print("LLM initialized successfully.")
+        app_state["llm"] = await asyncio.to_thread(make_chat_llm, model="gpt-4-turbo", temperature=0, api_key=OPENAI_API_KEY)
+        logger.info("LLM initialized successfully.")
     except Exception as e:
-        print(f"ERROR: Failed to initialize LLM: {e}")
+        logger.error("Failed to initialize LLM: %s", e)
         # App might still run if LLM is not critical for all endpoints, but chat will fail.
 
-    print("Initializing LangChain Router...")
+async def _load_schema_text():
+    """Reads the schema markdown once so workflows don't re-read it per run."""
+    logger.info("Loading schema from %s...", schema_path_abs)
+    try:
+        app_state["schema_text"] = await asyncio.to_thread(_read_text_file, schema_path_abs)
+    except OSError as e:
+        # Workflows fall back to reading the schema file themselves
+        logger.error("Failed to read schema file: %s", e)
+
+@app.on_event("startup")
+async def startup_event():
+    """Initialize Neo4j Driver, LLM, and LangChain Router on application startup."""
+    try:
+        # C-accelerated frame masking; without it every outbound frame is masked in pure Python
+        from websockets.speedups import apply_mask # noqa: F401
+        logger.info("websockets C speedups: loaded")
+    except ImportError:
+        logger.warning("websockets C speedups not available; WebSocket frames use the slow pure-Python path.")
+
+    # Independent steps run concurrently; each handles and logs its own failure
+    await asyncio.gather(_init_neo4j_driver(), _init_llm(), _load_schema_text())
+
+    logger.info("Initializing LangChain Router...")
     # Ensure driver is available (LLM not needed directly by Router init)
     if app_state["neo4j_driver"]:
         try:
             # Router initializes its own classifier and manages DB connection
             # It likely doesn't need LLM or connection details passed directly here
-            app_state["router"] = Router(schema_file=schema_path_abs)
-            print("LangChain Router initialized successfully.")
+            app_state["router"] = Router(schema_file=schema_path_abs, schema_text=app_state["schema_text"])
+            logger.info("LangChain Router initialized successfully.")
+            try:
+                # Pre-build the workflows (and the router's DB connection) off the event loop
+                await asyncio.to_thread(app_state["router"].warm_up)
+            except Exception as e:
+                # Not fatal: the router builds workflows lazily on the first request
+                logger.warning("Router warm-up failed, workflows will be built on first use: %s", e)
         except Exception as e:
-            print(f"ERROR: Failed to initialize Router: {e}")
+            logger.error("Failed to initialize Router: %s", e)
             # App can likely run, but chat functionality will fail
     else:
-        print("WARNING: Skipping Router initialization because Neo4j driver failed.")
+        logger.warning("Skipping Router initialization because Neo4j driver failed.")
+
+    if app_state["router"] and app_state["read_session"] and app_state["llm"]:
+        app_state["components"] = Components(
+            router=app_state["router"],
+            read_session=app_state["read_session"],
+            llm=app_state["llm"],
+            workflow_semaphore=app_state["workflow_semaphore"],
+        )
+    else:
+        logger.warning("Chat endpoint unavailable: Router, DB or LLM failed to initialize.")
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Close the Neo4j Driver on application shutdown."""
+    """Close the Router's resources, the shared database and the Neo4j Driver on application shutdown."""
+    if app_state["router"]:
+        logger.info("Closing LangChain Router...")
+        await asyncio.to_thread(app_state["router"].close)
+    # The process-wide Neo4jDatabase is shared by every Router, so it is closed here, once
+    await asyncio.to_thread(close_database)
     if app_state["neo4j_driver"]:
-        print("Closing Neo4j driver...")
+        logger.info("Closing Neo4j driver...")
         await app_state["neo4j_driver"].close()
-        print("Neo4j driver closed.")
+        logger.info("Neo4j driver closed.")
+    await close_shared_http_async_client()
+    _stop_log_listener()
 
 # --- Helper Function for Neo4j Query Execution --- 
-async def execute_neo4j_query(driver, query: str, params: dict = None):
-    """Executes a Cypher query and returns results as list of dicts or error string."""
-    if not driver:
-        return None, "Neo4j driver not available."
+# Temporal types returned by the driver (plus stdlib equivalents) that need converting
+# to ISO strings for JSON
+_TEMPORAL_TYPES = (Date, DateTime, Time, date, datetime, time)
+
+@functools.singledispatch
+def _to_json_value(value):
+    """Converts a driver value to something orjson can encode; dispatch is a dict lookup by type."""
+    return value
+
+def _temporal_to_iso(value) -> str:
+    return value.isoformat()
+
+for _temporal_type in _TEMPORAL_TYPES:
+    _to_json_value.register(_temporal_type, _temporal_to_iso)
+
+@_to_json_value.register(Duration)
+def _duration_to_iso(value: Duration) -> str:
+    return value.iso_format()
+
+@_to_json_value.register(list)
+def _list_to_json(value: list) -> list:
+    # Handle lists potentially containing temporal types
+    return [_to_json_value(item) for item in value]
+
+@_to_json_value.register(dict)
+def _dict_to_json(value: dict) -> dict:
+    # Maps and map projections (e.g. RETURN {created: n.created}) can hold temporals too
+    return {key: _to_json_value(item) for key, item in value.items()}
+
+async def records_to_dicts(result) -> List[Dict[str, Any]]:
+    """Result transformer: converts each Neo4j Record to a JSON-ready dict as it streams in.
+
+    Generated queries are prompted to toString() temporals server-side; any that slip
+    through become ISO strings here, in the same pass.
+    """
+    data = []
+    async for record in result:
+        record_dict = record.data()
+        for key, value in record_dict.items():
+            record_dict[key] = _to_json_value(value)
+        data.append(record_dict)
+    return data
+
+async def run_query_in_session(session, query: str, params: dict = None):
+    """Runs a Cypher query on an open session and returns (list of dicts, None) or (None, error string)."""
     try:
-        async with driver.session() as session:
-            response = await session.run(query, parameters=params)
-            # Convert Neo4j Records to list of dictionaries
-            data = [record.data() async for record in response]
-            # Convert temporal types to ISO strings for JSON serialization
-            processed_data = []
-            for record in data:
-                processed_record = {}
-                for key, value in record.items():
-                    # Add check for common temporal types from Neo4j driver and standard datetime
-                    if hasattr(value, 'isoformat'):
-                         processed_record[key] = value.isoformat()
-                    elif isinstance(value, list):
-                        # Handle lists potentially containing temporal types
-                        processed_record[key] = [
-                            item.isoformat() if hasattr(item, 'isoformat') else item
-                            for item in value
-                        ]
-                    else:
-                         processed_record[key] = value
-                processed_data.append(processed_record)
-            return processed_data, None # Return processed list of dicts and no error
+        response = await session.run(query, parameters=params)
+        return await records_to_dicts(response), None # Return list of dicts and no error
     except Exception as e:
-        error_message = f"Failed to execute query: {e}\nQuery: {query}\nParams: {params}"
-        print(f"ERROR: {error_message}")
+        logger.error("Failed to execute query: %s\nQuery: %s\nParams: %s", e, query, params)
         return None, str(e) # Return None for data and the error message string
 
+async def _query_worker(session_factory, jobs, futures: List[asyncio.Future]):
+    """Runs jobs from the shared iterator on one long-lived session, resolving each job's future."""
+    async with session_factory() as session:
+        for index, (query, on_start) in jobs:
+            if on_start is not None:
+                on_start()
+            futures[index].set_result(await run_query_in_session(session, query))
+
+def start_query_workers(session_factory, jobs: List[tuple], concurrency: int = QUERY_CONCURRENCY):
+    """Executes (query, on_start) jobs on up to `concurrency` sessions, one session per worker.
+
+    Returns (futures, workers): futures[i] resolves to job i's (data, error), so callers can
+    await results in job order while queries run concurrently. Jobs left unrun when the
+    workers stop (cancellation, session failure) resolve to an error instead of hanging.
+    """
+    loop = asyncio.get_running_loop()
+    futures = [loop.create_future() for _ in jobs]
+    job_iter = iter(enumerate(jobs)) # Shared by all workers; next() never interleaves between awaits
+    workers = [
+        asyncio.create_task(_query_worker(session_factory, job_iter, futures))
+        for _ in range(min(concurrency, len(jobs)))
+    ]
+
+    def _resolve_leftovers(_):
+        for future in futures:
+            if not future.done():
+                future.set_result((None, "Query was not executed (query worker stopped)."))
+
+    asyncio.gather(*workers, return_exceptions=True).add_done_callback(_resolve_leftovers)
+    return futures, workers
+
+# --- Helpers for Outbound WebSocket Frames ---
+
+def encode_frame(message) -> str:
+    """JSON-encodes an outbound message; pre-encoded frames (str) pass through untouched.
+
+    orjson does the encoding; the result is decoded to str because the frontend reads
+    text frames (react-use-websocket's lastJsonMessage), not binary ones. Values orjson
+    can't encode natively (e.g. neo4j temporals) fall back to json_default.
+    """
+    if isinstance(message, str):
+        return message
+    return orjson.dumps(message, default=json_default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+# Constant frames are encoded once at import time and queued as-is
+ROUTER_COMPLETED_FRAME = encode_frame({"type": "status", "step": "Processing", "status": "router_completed", "details": "Workflow generation finished. Proceeding to execution/analysis..."})
+EXECUTION_SKIPPED_FRAME = encode_frame({"type": "status", "step": "QueryExecution", "status": "skipped", "details": "No generated queries captured or required to execute."})
+QUEUED_FRAME = encode_frame({"type": "status", "step": "queued", "status": "waiting", "details": "Server busy; your request is queued."})
+COMPONENTS_UNAVAILABLE_FRAME = encode_frame({"type": "error", "message": "Backend components (Router, DB, LLM) not initialized."})
+UNKNOWN_WORKFLOW_WARNING_FRAME = encode_frame({"type": "warning", "step": "FinalAnalysis", "message": "Could not determine original workflow type to generate final analysis."})
+@functools.lru_cache(maxsize=64)
+def _status_frame_prefix(step: str, status: str) -> str:
+    """Encoded '{"type":"status","step":..,"status":..,"details":' prefix, built once per pair."""
+    return encode_frame({"type": "status", "step": step, "status": status})[:-1] + ',"details":'
+
+def status_frame(step: str, status: str, details: str) -> str:
+    """Builds a status frame from a cached prefix, encoding only the details string."""
+    return f"{_status_frame_prefix(step, status)}{orjson.dumps(details).decode()}}}"
+
+def running_query_frame(objective: str, index: int) -> str:
+    """Builds the per-query 'running_query' status frame (adds the query index)."""
+    return f'{_status_frame_prefix("QueryExecution", "running_query")}{orjson.dumps(f"Running: {objective}").decode()},"index":{index}}}'
+
+_FINAL_ANALYSIS_ERROR_PREFIX = '{"type":"error","step":"FinalAnalysis","message":'
+
+def final_analysis_error_frame(message: str, details: Optional[str] = None) -> str:
+    """Builds the FinalAnalysis error frame, encoding only the variable fields."""
+    frame = f'{_FINAL_ANALYSIS_ERROR_PREFIX}{orjson.dumps(message).decode()}'
+    if details is not None:
+        frame += f',"details":{orjson.dumps(details).decode()}'
+    return frame + "}"
+# Encoded frames above this size are never joined into a batch envelope
+LARGE_FRAME_CHARS = 64 * 1024
+
+async def _send_batch(websocket: WebSocket, frames: List[str]):
+    """Sends already-encoded frames: one as-is, several wrapped in a batch envelope."""
+    if len(frames) == 1:
+        await websocket.send_text(frames[0])
+    elif frames:
+        await websocket.send_text('{"type":"batch","messages":[' + ",".join(frames) + "]}")
+
+# Batching window: wait up to BATCH_MAX_DELAY seconds for more messages (at most
+# BATCH_MAX_SIZE per frame) unless a message the user is waiting on arrives
+BATCH_MAX_DELAY = 0.01
+BATCH_MAX_SIZE = 32
+FLUSH_MESSAGE_TYPES = frozenset({"error", "reasoning_summary", "final_insight", "final_recommendation"})
+
+def _is_flush_message(message) -> bool:
+    """True for messages that should go out immediately (pre-encoded errors included)."""
+    if isinstance(message, str):
+        return message.startswith('{"type":"error"')
+    return message.get("type") in FLUSH_MESSAGE_TYPES
+
+def _encode_or_error_frame(message) -> str:
+    """Encodes one outbound message; a message that can't be encoded becomes an error frame instead."""
+    try:
+        return encode_frame(message)
+    except TypeError as e: # orjson.JSONEncodeError subclasses TypeError
+        step = message.get("step") if isinstance(message, dict) else None
+        logger.error("Could not encode outbound %r message (step %s): %s", message.get("type") if isinstance(message, dict) else type(message).__name__, step, e)
+        payload = {"type": "error", "message": f"Could not encode server message: {e}"}
+        if step:
+            payload["step"] = step
+        return encode_frame(payload)
+
+def _with_seq(frame: str, seq: int) -> str:
+    """Splices a per-connection sequence number into an encoded JSON object frame."""
+    return f'{{"seq":{seq},{frame[1:]}' if frame != "{}" else f'{{"seq":{seq}}}'
+
+async def websocket_writer(websocket: WebSocket, out_q: asyncio.Queue):
+    """Drains the outbound queue, coalescing messages that arrive close together into one frame.
+
+    After the first message the writer lingers for BATCH_MAX_DELAY (up to BATCH_MAX_SIZE
+    messages), flushing early on error/reasoning/final messages. A lone message is sent
+    as-is; several are wrapped in a {"type": "batch", "messages": [...]} envelope which
+    the frontend unwraps. Frames larger than LARGE_FRAME_CHARS are always sent unbatched.
+    Every message carries a monotonically increasing "seq" so the client can detect gaps.
+    """
+    loop = asyncio.get_running_loop()
+    seq = 0
+    while True:
+        message = await out_q.get()
+        batch = [message]
+        deadline = loop.time() + BATCH_MAX_DELAY
+        while len(batch) < BATCH_MAX_SIZE and not _is_flush_message(batch[-1]):
+            if not out_q.empty():
+                batch.append(out_q.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(out_q.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        try:
+            # Large frames go out on their own (order preserved) so they are
+            # never copied into an even larger batch string. Encoding failures are
+            # per message (see _encode_or_error_frame) and never stop the writer.
+            small = []
+            for message in batch:
+                frame = _with_seq(_encode_or_error_frame(message), seq)
+                seq += 1
+                if len(frame) > LARGE_FRAME_CHARS:
+                    await _send_batch(websocket, small)
+                    small = []
+                    await websocket.send_text(frame)
+                else:
+                    small.append(frame)
+            await _send_batch(websocket, small)
+        except Exception as e:
+            # Only a failed send ends the writer: the socket is gone, and the handler
+            # notices on its next receive.
+            logger.warning("WebSocket writer stopped: %s", e)
+            return
+        finally:
+            for _ in batch:
+                out_q.task_done()
+
+# Once this many frames are waiting for a slow client, progress-only status messages are dropped
+OUTBOUND_SOFT_LIMIT = 256
+# Progress statuses that a later message supersedes; completed/skipped/workflow-end statuses
+# are terminal (the frontend clears its processing state on them) and always delivered
+SHEDDABLE_STATUSES = frozenset({"in_progress", "running_query"})
+
+def _is_sheddable_status(message) -> bool:
+    """True for in-progress status messages, whether still a dict or already encoded by status_frame()."""
+    if isinstance(message, str):
+        if not message.startswith('{"type":"status"'):
+            return False
+        head = message.split(',"details":', 1)[0] # step/status precede the free-text details
+        return any(f'"status":"{status}"' in head for status in SHEDDABLE_STATUSES)
+    return message.get("type") == "status" and message.get("status") in SHEDDABLE_STATUSES
+
+def enqueue_outbound(out_q: asyncio.Queue, message):
+    """Queues a message for the writer task, shedding progress updates when the client falls behind.
+
+    Results, errors, final messages and terminal statuses are always queued, so the
+    workflow never blocks on the socket; only in-progress/running_query statuses are
+    dropped past OUTBOUND_SOFT_LIMIT.
+    """
+    if out_q.qsize() >= OUTBOUND_SOFT_LIMIT and _is_sheddable_status(message):
+        logger.debug("Outbound queue backed up (%s frames); dropping progress status.", out_q.qsize())
+        return
+    out_q.put_nowait(message)
+
+async def flush_outbound(out_q: asyncio.Queue, writer_task: asyncio.Task, timeout: float = 5.0):
+    """Waits (bounded) for queued frames to be written, e.g. before closing the socket."""
+    if writer_task.done():
+        return
+    try:
+        await asyncio.wait_for(out_q.join(), timeout)
+    except asyncio.TimeoutError:
+        logger.warning("Timed out flushing outbound WebSocket frames.")
+
+# Placeholder for reasoning that was not captured from the workflow stream
+_NA = "N/A"
+
+# Cap on traceback text sent to the client (keeps error frames small)
+# Client-facing tracebacks are bounded: innermost frames only, last few lines
+MAX_TRACEBACK_FRAMES = 2
+MAX_TRACEBACK_LINES = 5
+
+async def format_traceback(exc: BaseException) -> str:
+    """Formats the tail of an exception's traceback in a worker thread (full traceback goes to the log)."""
+    tb_lines = await asyncio.to_thread(traceback.format_exception, exc, limit=-MAX_TRACEBACK_FRAMES)
+    return "\n".join("".join(tb_lines).splitlines()[-MAX_TRACEBACK_LINES:])
+
+# Tracebacks are always logged server-side; they are only sent to the client when enabled
+WS_INCLUDE_TRACEBACKS = os.getenv("GRAPHDB_WS_INCLUDE_TB", "false").lower() in ("1", "true", "yes")
+
+async def _error_payload(step: Optional[str], message: str, exc: BaseException, include_tb: bool = WS_INCLUDE_TRACEBACKS) -> Dict[str, Any]:
+    """Builds a client error message; the traceback is only formatted when include_tb is set."""
+    payload = {"type": "error", "message": message}
+    if step:
+        payload["step"] = step
+    if include_tb:
+        payload["details"] = await format_traceback(exc)
+    return payload
+
 # --- API Endpoints --- 
 
 @app.get("/")
@@ -190,293 +621,373 @@ async def read_root():
 
 # --- WebSocket Endpoint for Chat --- 
 
+# --- Final Analysis Dispatch ---
+
+def _insight_agent_input(user_query: str, all_query_results: List[Dict[str, Any]], captured_reasoning: Optional[str]) -> Dict[str, Any]:
+    """Insight agent gets the flat result list plus the query generator's reasoning."""
+    return {"query": user_query, "data": all_query_results, "query_generation_reasoning": captured_reasoning or _NA}
+
+def _optimization_agent_input(user_query: str, all_query_results: List[Dict[str, Any]], captured_reasoning: Optional[str]) -> Dict[str, Any]:
+    """Optimization agent gets the results grouped by query objective."""
+    grouped_results = defaultdict(list)
+    for result_item in all_query_results:
+        grouped_results[result_item.get("objective", "Unknown Objective")].append(result_item)
+    return {"query": user_query, "data": dict(grouped_results)}
+
+# workflow_type -> (text agent factory, final message type, input builder)
+FINAL_ANALYSIS_DISPATCH = {
+    "insight": (get_insight_generator_agent, "final_insight", _insight_agent_input),
+    "optimization": (get_optimization_recommendation_agent, "final_recommendation", _optimization_agent_input),
+}
+
+async def _run_graph_agent(graph_agent, graph_agent_input: Dict[str, Any]):
+    """Invokes the graph agent, returning (not raising) its exception so it can't cancel the text agent."""
+    try:
+        return await graph_agent.suggest(graph_agent_input)
+    except Exception as e:
+        return e
+
+VALID_WORKFLOWS = frozenset(FINAL_ANALYSIS_DISPATCH)
+# Workflow chunks that carry a final answer (sent directly when no execution is needed)
+FINAL_CHUNK_TYPES = frozenset({"final_insight", "final_recommendation"})
+
 @app.websocket("/api/v1/chat/stream")
 async def websocket_chat(websocket: WebSocket):
+    """Streams workflow progress, query results and the final analysis for each user query.
+
+    Backpressure: outbound frames are queued in-process and written by a separate
+    writer task, so the handler itself never blocks on a slow client. The server is
+    started with a 16 MiB max frame size (large final_response / query_result
+    payloads) and a deeper inbound queue; the trade-off is that a client which stops
+    reading lets memory grow until the ping timeout drops the connection. This is
+    acceptable for our trusted single-user frontend, not for untrusted fan-out.
+    """
     await websocket.accept()
-    print("WebSocket connection established.")
-
-    router = app_state.get("router")
-    neo4j_driver = app_state.get("neo4j_driver")
-    llm = app_state.get("llm") # Get LLM instance
+    logger.info("WebSocket connection established.")
 
-    if not router or not neo4j_driver or not llm:
-        await websocket.send_json({"type": "error", "message": "Backend components (Router, DB, LLM) not initialized."})
+    components: Optional[Components] = app_state["components"]
+    if components is None:
+        await websocket.send_text(COMPONENTS_UNAVAILABLE_FRAME)
         await websocket.close()
         return
+    router = components.router
+    read_session = components.read_session
+    workflow_semaphore = components.workflow_semaphore
+
+    # Outbound frames go through a queue drained by a dedicated writer task so
+    # the handler never waits on socket drains between steps.
+    out_q: asyncio.Queue = asyncio.Queue()
+    writer_task = asyncio.create_task(websocket_writer(websocket, out_q))
+    send = functools.partial(enqueue_outbound, out_q) # Local binding; used for every outbound message below
 
     try:
         while True:
             # Wait for a message (user query) from the client
-            user_query = await websocket.receive_text()
-            print(f"Received message: {user_query}")
-
-            generated_queries_list = [] # To store queries for execution later
-            workflow_type = None # To store 'insight' or 'optimization'
-            requires_execution = True # Assume execution needed unless told otherwise
-            final_workflow_message = None # Store messages like final_insight/final_recommendation if execution not needed
-            captured_reasoning = None # Variable to store query generation reasoning
-
-            # --- Start LangChain Router Processing --- 
-            try:
-                async for chunk in router.run(user_query=user_query):
-                    # Send each chunk (status, reasoning, data, etc.) to the client
-                    await websocket.send_json(chunk)
-
-                    # Capture routing decision (Assuming router yields this first)
-                    if chunk.get("type") == "routing_decision":
-                        workflow_type = chunk.get("workflow_type")
-                        print(f"Router decided on workflow: {workflow_type}")
+            chat_request = parse_chat_request(await websocket.receive_text())
+            if chat_request is None:
+                continue # Acks are informational; delivery is never gated on them
+            user_query = chat_request.query
+            logger.info("Received message: %s", user_query)
+
+            # Admission control: bound concurrent workflows across all connections
+            if workflow_semaphore.locked():
+                send(QUEUED_FRAME)
+            async with workflow_semaphore:
+                generated_queries_list = [] # To store queries for execution later
+                workflow_type = None # To store 'insight' or 'optimization'
+                requires_execution = True # Assume execution needed unless told otherwise
+                final_workflow_message = None # Store messages like final_insight/final_recommendation if execution not needed
+                captured_reasoning = None # Variable to store query generation reasoning
+
+                # --- Start LangChain Router Processing --- 
+                try:
+                    async for chunk in router.run(user_query=user_query, workflow_type=chat_request.workflow_type):
+                        # Send each chunk (status, reasoning, data, etc.) to the client
+                        send(chunk)
+
+                        chunk_type = chunk.get("type")
+                        # Capture routing decision (Assuming router yields this first)
+                        if chunk_type == "routing_decision":
+                            workflow_type = chunk.get("workflow_type")
+                            logger.info("Router decided on workflow: %s", workflow_type)
                     
-                    # Capture generated queries (standardized step name)
-                    if chunk.get("type") == "status" and chunk.get("step") == "generate_queries" and chunk.get("status") == "completed":
-                        if isinstance(chunk.get("generated_queries"), list):
-                            generated_queries_list = chunk["generated_queries"]
-                            print(f"Captured {len(generated_queries_list)} generated queries from step: {chunk.get('step')}.")
-                        else:
-                             print("WARNING: generate_queries completed but 'generated_queries' key missing or not a list.")
+                        # Capture generated queries (standardized step name)
+                        if chunk_type == "status" and chunk.get("step") == "generate_queries" and chunk.get("status") == "completed":
+                            if isinstance(queries := chunk.get("generated_queries"), list):
+                                generated_queries_list = queries
+                                logger.debug("Captured %s generated queries from step: %s.", len(generated_queries_list), chunk.get('step'))
+                            else:
+                                 logger.warning("generate_queries completed but 'generated_queries' key missing or not a list.")
                              
-                    # Capture reasoning summary associated with query generation
-                    if chunk.get("type") == "reasoning_summary" and chunk.get("step") == "generate_queries":
-                        captured_reasoning = chunk.get("reasoning", "N/A") # Store reasoning, default to N/A
-                        print(f"Captured query generation reasoning.")
-
-                    # Capture final message if workflow indicates no execution needed
-                    if chunk.get("type") in ["final_insight", "final_recommendation"] and not chunk.get("requires_execution", True):
-                         requires_execution = False
-                         final_workflow_message = chunk # Store the message to send later
-                         print(f"Workflow indicated no query execution needed. Capturing final message.")
+                        # Capture reasoning summary associated with query generation
+                        if chunk_type == "reasoning_summary" and chunk.get("step") == "generate_queries":
+                            captured_reasoning = chunk.get("reasoning", _NA) # Store reasoning, default to N/A
+                            logger.debug("Captured query generation reasoning.")
+
+                        # Capture final message if workflow indicates no execution needed
+                        if chunk_type in FINAL_CHUNK_TYPES and not chunk.get("requires_execution", True):
+                             requires_execution = False
+                             final_workflow_message = chunk # Store the message to send later
+                             logger.debug("Workflow indicated no query execution needed. Capturing final message.")
                 
-                # Indicate main router processing finished
-                await websocket.send_json({"type": "status", "step": "Processing", "status": "router_completed", "details": "Workflow generation finished. Proceeding to execution/analysis..."})
+                    # Indicate main router processing finished
+                    send(ROUTER_COMPLETED_FRAME)
 
-            except Exception as e:
-                print(f"ERROR during router execution: {e}")
-                import traceback
-                tb_str = traceback.format_exc()
-                await websocket.send_json({"type": "error", "message": f"Error processing request: {e}", "details": tb_str })
-                continue # Skip steps below if router failed
-
-            # --- Step 2: Execute Generated Queries (if any and required) --- 
-            all_query_results = [] # Store results: List[Dict(objective, query, data, error)]
-            execution_completed_successfully = False
-
-            if generated_queries_list and requires_execution:
-                await websocket.send_json({"type": "status", "step": "QueryExecution", "status": "in_progress", "details": f"Executing {len(generated_queries_list)} captured queries..."})
+                except Exception as e:
+                    logger.exception("Error during router execution: %s", e)
+                    send(await _error_payload(None, f"Error processing request: {e}", e))
+                    continue # Skip steps below if router failed
+
+                # --- Step 2: Execute Generated Queries (if any and required) --- 
+                all_query_results = [] # Store results: List[Dict(objective, query, data, error)]
+                execution_completed_successfully = False
+
+                if generated_queries_list and requires_execution:
+                    send(status_frame("QueryExecution", "in_progress", f"Executing {len(generated_queries_list)} captured queries..."))
                 
-                results_processed_count = 0
-                execution_has_errors = False
-                for i, query_item in enumerate(generated_queries_list):
-                    if isinstance(query_item, dict) and "query" in query_item:
-                        objective = query_item.get("objective", f"Query {i+1}") # Use objective from item
-                        query_text = query_item.get("query")
-                        
-                        await websocket.send_json({"type": "status", "step": "QueryExecution", "status": "running_query", "details": f"Running: {objective}", "index": i})
+                    results_processed_count = 0
+                    execution_has_errors = False
+
+                    valid_items = [] # (index, objective, query_text)
+                    for i, query_item in enumerate(generated_queries_list):
+                        if isinstance(query_item, dict) and (query_text := query_item.get("query")) is not None:
+                            valid_items.append((i, query_item.get("objective", f"Query {i+1}"), query_text)) # Use objective from item
+                        else:
+                             logger.info("Skipping invalid query item at index %s: %s", i, query_item)
+                             send({"type": "warning", "step": "QueryExecution", "message": f"Skipping invalid query item at index {i}.", "details": str(query_item)})
+
+                    # Per-query "running_query" progress: none for a single query (the in_progress and
+                    # final statuses say it all), otherwise at most ~10 updates spread over the run
+                    progress_every = math.ceil(len(valid_items) / 10) if len(valid_items) > 1 else 0
+
+                    # Queries are independent, so run them concurrently on up to QUERY_CONCURRENCY
+                    # sessions (one per worker, reused across queries); results are still consumed
+                    # and sent in query order
+                    query_futures, query_workers = start_query_workers(read_session, [
+                        (query_text, functools.partial(send, running_query_frame(objective, i)) if progress_every and pos % progress_every == 0 else None)
+                        for pos, (i, objective, query_text) in enumerate(valid_items)
+                    ])
+                    try:
+                        for (i, objective, query_text), query_future in zip(valid_items, query_futures):
+                            # Execute query and get data/error
+                            data, error = await query_future
                         
-                        # Execute query and get data/error
-                        data, error = await execute_neo4j_query(neo4j_driver, query_text)
+                            # Store result details
+                            result_detail = {
+                                "objective": objective,
+                                "query": query_text,
+                                "data": data, # Will be None if error occurred
+                                "error": error # Will be None if success
+                            }
+                            all_query_results.append(result_detail)
                         
-                        # Store result details
-                        result_detail = {
-                            "objective": objective,
-                            "query": query_text,
-                            "data": data, # Will be None if error occurred
-                            "error": error # Will be None if success
-                        }
-                        all_query_results.append(result_detail)
+                            # Send result back to client (individual query result)
+                            result_message = {
+                                "type": "query_result",
+                                "objective": objective,
+                                "query": query_text, # Include query for context
+                                "index": i,
+                            }
+                            if error:
+                                result_message["error"] = error
+                                execution_has_errors = True # Mark that at least one error occurred
+                            else:
+                                # Send data only if no error
+                                result_message["data"] = data 
                         
-                        # Send result back to client (individual query result)
-                        result_message = {
-                            "type": "query_result",
-                            "objective": objective,
-                            "query": query_text, # Include query for context
-                            "index": i,
-                        }
-                        if error:
-                            result_message["error"] = error
-                            execution_has_errors = True # Mark that at least one error occurred
-                        else:
-                            # Send data only if no error
-                            result_message["data"] = data 
-                        
-                        await websocket.send_json(result_message)
-                        results_processed_count += 1
+                            # Sent as soon as it resolves; the writer coalesces results that land close together
+                            send(result_message)
+                            results_processed_count += 1
+                    finally:
+                        # Don't leave queries running if the handler bails out early
+                        for query_worker in query_workers:
+                            query_worker.cancel()
+
+                    # Final status for Query Execution phase
+                    status_detail = f"Finished executing {results_processed_count} queries."
+                    final_status = "completed"
+                    if execution_has_errors:
+                        status_detail += " Some queries failed."
+                        final_status = "completed_with_errors"
                     else:
-                         print(f"Skipping invalid query item at index {i}: {query_item}")
-                         await websocket.send_json({"type": "warning", "step": "QueryExecution", "message": f"Skipping invalid query item at index {i}.", "details": str(query_item)})
-
-                # Final status for Query Execution phase
-                status_detail = f"Finished executing {results_processed_count} queries."
-                final_status = "completed"
-                if execution_has_errors:
-                    status_detail += " Some queries failed."
-                    final_status = "completed_with_errors"
-                else:
-                     execution_completed_successfully = True # Mark successful completion
+                         execution_completed_successfully = True # Mark successful completion
                      
-                await websocket.send_json({"type": "status", "step": "QueryExecution", "status": final_status, "details": status_detail})
+                    send(status_frame("QueryExecution", final_status, status_detail))
             
-            elif not generated_queries_list and final_workflow_message:
-                 # Workflow generated no queries but provided a final message directly
-                 await websocket.send_json(final_workflow_message)
-                 print("Sent final message provided directly by workflow (no execution needed).")
-                 # Skip final analysis section as workflow handled it
-                 execution_completed_successfully = False # Prevent final analysis step
+                elif not generated_queries_list and final_workflow_message:
+                     # Workflow generated no queries but provided a final message directly
+                     send(final_workflow_message)
+                     logger.debug("Sent final message provided directly by workflow (no execution needed).")
+                     # Skip final analysis section as workflow handled it
+                     execution_completed_successfully = False # Prevent final analysis step
             
-            else:
-                 # No queries generated and no specific message -> Skipped execution
-                 await websocket.send_json({"type": "status", "step": "QueryExecution", "status": "skipped", "details": "No generated queries captured or required to execute."})
-                 execution_completed_successfully = False # Prevent final analysis step
-
-            # --- Step 3: Final Analysis / Recommendation Generation --- 
-            if execution_completed_successfully and workflow_type:
-                # Proceed only if execution finished without critical errors AND we know the workflow type
-                await websocket.send_json({"type": "status", "step": "FinalAnalysis", "status": "in_progress", "details": f"Generating final {workflow_type} and graph suggestion..."})
+                else:
+                     # No queries generated and no specific message -> Skipped execution
+                     send(EXECUTION_SKIPPED_FRAME)
+                     execution_completed_successfully = False # Prevent final analysis step
+
+                # --- Step 3: Final Analysis / Recommendation Generation --- 
+                if execution_completed_successfully and workflow_type:
+                    # Proceed only if execution finished without critical errors AND we know the workflow type
+                    send(status_frame("FinalAnalysis", "in_progress", f"Generating final {workflow_type} and graph suggestion..."))
                 
-                # Instantiate agents
-                final_text_agent = None
-                graph_agent = None
-                final_message_type = "final_insight" # Default
+                    # Shared agent instances (built on first use, then reused)
+                    final_text_agent = None
+                    graph_agent = None
+                    final_message_type = "final_insight" # Default
                 
-                try:
-                    # Instantiate the graph agent (always needed)
-                    graph_agent = GraphGeneratorAgent()
-
-                    # Instantiate the correct text-based agent
-                    if workflow_type == "insight":
-                        final_text_agent = InsightGeneratorAgent()
-                        final_message_type = "final_insight"
-                    elif workflow_type == "optimization":
-                        final_text_agent = OptimizationRecommendationGeneratorAgent()
-                        final_message_type = "final_recommendation"
-                    else:
-                        raise ValueError(f"Unknown workflow type for final analysis: {workflow_type}")
+                    try:
+                        # Get the graph agent (always needed)
+                        graph_agent = get_graph_generator_agent()
+
+                        # Get the correct text-based agent and build its input
+                        if workflow_type not in VALID_WORKFLOWS:
+                            raise ValueError(f"Unknown workflow type for final analysis: {workflow_type}")
+                        get_text_agent, final_message_type, build_text_agent_input = FINAL_ANALYSIS_DISPATCH[workflow_type]
+                        final_text_agent = get_text_agent()
+                        text_agent_input = build_text_agent_input(user_query, all_query_results, captured_reasoning)
                     
-                    # Prepare inputs for both agents
-                    # Text agent input varies
-                    text_agent_input = {}
-                    if workflow_type == "insight":
-                        text_agent_input = {"query": user_query, "data": all_query_results, "query_generation_reasoning": captured_reasoning or "N/A"}
-                    elif workflow_type == "optimization":
-                        grouped_results = {}
-                        for result_item in all_query_results:
-                            objective = result_item.get("objective", "Unknown Objective")
-                            if objective not in grouped_results:
-                                grouped_results[objective] = []
-                            grouped_results[objective].append(result_item)
-                        text_agent_input = {"query": user_query, "data": grouped_results}
-                    
-                    # Graph agent input now takes the flat list of all query result objects
-                    graph_agent_input = {"query": user_query, "data": all_query_results}
-
-                    # Invoke agents concurrently using asyncio.gather
-                    print(f"---> Invoking final text agent ({workflow_type}) and graph agent concurrently...")
-                    text_agent_task = final_text_agent.chain.ainvoke(text_agent_input)
-                    graph_agent_task = graph_agent.chain.ainvoke(graph_agent_input)
-                    
-                    # Gather results, return_exceptions=True handles errors in either task
-                    results = await asyncio.gather(text_agent_task, graph_agent_task, return_exceptions=True)
-                    
-                    text_agent_output = results[0]
-                    graph_agent_output = results[1]
-                    print(f"<--- Concurrent agent invocation finished.")
-                    # Add specific log for the graph agent's raw output or exception
-                    print(f"---> Raw graph_agent_output: {graph_agent_output}")
-
-                    # Send Graph Suggestion Message Separately (if successful)
-                    graph_suggestions_list = None # Expect a list now
-                    if isinstance(graph_agent_output, Exception):
-                        print(f"!!! ERROR in graph agent: {graph_agent_output}")
-                        # Optionally send a graph error message or just log it
-                        # await websocket.send_json({"type": "graph_suggestion_error", "error": str(graph_agent_output)})
-                        graph_suggestions_list = [] # Send empty list on error
-                    elif isinstance(graph_agent_output, dict) and 'graph_suggestions' in graph_agent_output and isinstance(graph_agent_output['graph_suggestions'], list):
-                        graph_suggestions_list = graph_agent_output['graph_suggestions'] # Extract the list
-                    else:
-                        print(f"WARNING: Graph agent returned unexpected structure: {graph_agent_output}")
-                        graph_suggestions_list = [] # Send empty list on format error
-                        
-                    # Send the list of suggestions (even if empty)
-                    if graph_suggestions_list is not None: # Check if processing happened
+                        # Graph agent input now takes the flat list of all query result objects. It is
+                        # serialized for the prompt once here and shared with the text agent when that
+                        # agent takes the same flat list (insight); `data` stays for cache keying.
+                        data_json = dumps_prompt_data(all_query_results)
+                        graph_agent_input = {"query": user_query, "data": all_query_results, "data_json": data_json}
+                        if text_agent_input.get("data") is all_query_results:
+                            text_agent_input["data_json"] = data_json
+
+                        # Invoke agents concurrently: a text agent failure (or cancellation of this
+                        # handler) cancels the graph agent mid-flight, since there is no final message to
+                        # attach it to, while a graph agent failure is returned by _run_graph_agent and
+                        # never cancels the text agent
+                        logger.debug("---> Invoking final text agent (%s) and graph agent concurrently...", workflow_type)
+                        graph_agent_task = asyncio.create_task(_run_graph_agent(graph_agent, graph_agent_input))
                         try:
-                            # Send message with type 'graph_suggestions' (plural) and the list
-                            await websocket.send_json({"type": "graph_suggestions", "suggestions": graph_suggestions_list})
-                            print(f"Graph suggestions message sent to client ({len(graph_suggestions_list)} suggestions).")
-                        except Exception as send_err:
-                             print(f"ERROR sending graph suggestion message: {send_err}")
-
-                    # Process Text Agent Result and Send Final Message
-                    final_message_payload = {} # Start fresh for the text message
-                    text_agent_failed = False
-                    if isinstance(text_agent_output, Exception):
-                        print(f"!!! ERROR in final text agent ({workflow_type}): {text_agent_output}")
-                        tb_str = "".join(traceback.format_exception(type(text_agent_output), text_agent_output, text_agent_output.__traceback__))
-                        final_message_payload['error_details'] = f"Text Generation Error: {text_agent_output}\n{tb_str}"
-                        if workflow_type == "insight": final_message_payload['insight'] = "Error generating insight."
-                        else: final_message_payload['optimization_report'] = "Error generating report."
-                        text_agent_failed = True
-                    elif isinstance(text_agent_output, dict):
-                        # Expecting keys like report_sections (list) and reasoning (str)
-                        # We'll pass the whole dict payload for now, frontend can extract sections
-                        final_message_payload.update(text_agent_output)
-                    else:
-                        print(f"WARNING: Final text agent ({workflow_type}) returned unexpected type: {type(text_agent_output)}")
-                        # Set default structure for error case
-                        if workflow_type == "insight": 
-                            final_message_payload['insight'] = "Unexpected output format."
-                        else: 
-                            final_message_payload['report_sections'] = [{'title': 'Error', 'content': 'Unexpected output format from agent.'}]
-                        text_agent_failed = True
+                            text_agent_output = await final_text_agent.chain.ainvoke(text_agent_input)
+                        except BaseException as e:
+                            graph_agent_task.cancel()
+                            if not isinstance(e, Exception):
+                                raise
+                            text_agent_output = e
+                        # A cancelled graph agent comes back as CancelledError and fails validation below
+                        graph_agent_output, = await asyncio.gather(graph_agent_task, return_exceptions=True)
+                        logger.debug("<--- Concurrent agent invocation finished.")
+                        # Add specific log for the graph agent's raw output or exception
+                        logger.debug("---> Raw graph_agent_output: %r", graph_agent_output)
+
+                        # Send Graph Suggestion Message Separately (empty list on error or bad format)
+                        # A returned/cancelled graph agent (Exception or None) fails validation just like a malformed dict
+                        try:
+                            graph_suggestions_list = GraphAgentOutput.model_validate(graph_agent_output).graph_suggestions
+                        except ValidationError:
+                            logger.warning("Graph agent failed or returned unexpected structure: %s", graph_agent_output)
+                            graph_suggestions_list = []
+
+                        # Send the list of suggestions (even if empty)
+                        send({"type": "graph_suggestions", "suggestions": graph_suggestions_list})
+                        logger.debug("Graph suggestions message queued for client (%s suggestions).", len(graph_suggestions_list))
+
+                        # Process Text Agent Result and Send Final Message
+                        final_message_payload = {} # Start fresh for the text message
+                        text_agent_failed = False
+                        if isinstance(text_agent_output, Exception):
+                            logger.error("Error in final text agent (%s): %s", workflow_type, text_agent_output, exc_info=text_agent_output)
+                            final_message_payload['error_details'] = f"Text Generation Error: {text_agent_output}"
+                            if WS_INCLUDE_TRACEBACKS:
+                                final_message_payload['error_details'] += "\n" + await format_traceback(text_agent_output)
+                            if workflow_type == "insight": final_message_payload['insight'] = "Error generating insight."
+                            else: final_message_payload['optimization_report'] = "Error generating report."
+                            text_agent_failed = True
+                        elif isinstance(text_agent_output, dict):
+                            # Expecting keys like report_sections (list) and reasoning (str)
+                            # The agent's dict is ephemeral, so reuse it as the payload instead of copying
+                            final_message_payload = text_agent_output
+                        else:
+                            logger.warning("Final text agent (%s) returned unexpected type: %s", workflow_type, type(text_agent_output))
+                            # Set default structure for error case
+                            if workflow_type == "insight": 
+                                final_message_payload['insight'] = "Unexpected output format."
+                            else: 
+                                final_message_payload['report_sections'] = [{'title': 'Error', 'content': 'Unexpected output format from agent.'}]
+                            text_agent_failed = True
                         
-                    # Send the final text-based message (insight/recommendation)
-                    final_status = "completed_with_errors" if text_agent_failed else "completed"
-                    message_to_send = {
-                        "type": final_message_type, 
-                        "step": "FinalAnalysis", # Step name might need adjustment if we consider graph separate
-                        "status": final_status, 
-                        **final_message_payload # Excludes graph suggestion
-                    }
-                    print(f"Sending final {final_message_type} message: (Keys: {list(message_to_send.keys())})") 
-                    await websocket.send_json(message_to_send)
-                    print(f"Final {workflow_type} message sent to client.")
-
-                except Exception as final_agent_setup_err:
-                    print(f"!!! ERROR during final agent setup/invocation: {final_agent_setup_err}")
-                    import traceback
-                    tb_str = traceback.format_exc()
-                    print(tb_str)
-                    await websocket.send_json({"type": "error", "step": "FinalAnalysis", "message": f"Failed during final analysis setup/invocation: {final_agent_setup_err}", "details": tb_str})
-
-            elif execution_completed_successfully and not workflow_type:
-                 print("WARNING: Query execution completed but workflow type unknown. Skipping final analysis.")
-                 await websocket.send_json({"type": "warning", "step": "FinalAnalysis", "message": "Could not determine original workflow type to generate final analysis."}) 
-            else:
-                 # Execution was skipped or failed with errors deemed critical earlier
-                 print("Skipping final analysis step due to skipped/failed execution or missing workflow type.")
+                        # Send the final text-based message (insight/recommendation)
+                        final_status = "completed_with_errors" if text_agent_failed else "completed"
+                        # Envelope fields are set in place; the payload is consumed by send() and must not be reused
+                        final_message_payload["type"] = final_message_type
+                        final_message_payload["step"] = "FinalAnalysis" # Step name might need adjustment if we consider graph separate
+                        final_message_payload["status"] = final_status
+                        if logger.isEnabledFor(logging.DEBUG): # Avoid building the key list when not logged
+                            logger.debug("Sending final %s message: (Keys: %s)", final_message_type, list(final_message_payload.keys()))
+                        send(final_message_payload)
+                        logger.debug("Final %s message sent to client.", workflow_type)
+
+                    except Exception as final_agent_setup_err:
+                        logger.exception("Error during final agent setup/invocation: %s", final_agent_setup_err)
+                        tb_str = await format_traceback(final_agent_setup_err) if WS_INCLUDE_TRACEBACKS else None
+                        send(final_analysis_error_frame(f"Failed during final analysis setup/invocation: {final_agent_setup_err}", tb_str))
+
+                elif execution_completed_successfully and not workflow_type:
+                     logger.warning("Query execution completed but workflow type unknown. Skipping final analysis.")
+                     send(UNKNOWN_WORKFLOW_WARNING_FRAME) 
+                else:
+                     # Execution was skipped or failed with errors deemed critical earlier
+                     logger.info("Skipping final analysis step due to skipped/failed execution or missing workflow type.")
                  
-            print(f"--- Full processing finished for user query: {user_query} --- ")
+                logger.info("--- Full processing finished for user query: %s --- ", user_query)
+                if logger.isEnabledFor(logging.DEBUG): # cache_stats() builds dicts; skip it unless logged
+                    logger.debug("Router cache stats: %s", router.cache_stats())
 
     except WebSocketDisconnect:
-        print("WebSocket disconnected.")
+        logger.info("WebSocket disconnected.")
     except Exception as e:
-        print(f"ERROR in WebSocket handler: {e}")
-        import traceback
-        tb_str = traceback.format_exc()
+        logger.exception("Error in WebSocket handler: %s", e)
         try:
-            # Try sending error before closing if connection is still open
-            await websocket.send_json({"type": "error", "message": f"Unexpected WebSocket error: {e}", "details": tb_str})
+            # Only build/send the error if the client can still receive it
+            if websocket.client_state == WebSocketState.CONNECTED and not writer_task.done():
+                send(await _error_payload(None, f"Unexpected WebSocket error: {e}", e))
+                await flush_outbound(out_q, writer_task)
         except Exception:
             pass # Ignore error if sending fails (connection likely closed)
         finally:
              # Ensure connection is closed on error
+             writer_task.cancel()
              try:
                  await websocket.close()
              except Exception:
                  pass # Ignore if already closed
+    finally:
+        # Stop the writer once the handler exits (no-op if already cancelled)
+        writer_task.cancel()
 
 # --- Run the app (for local development) --- 
 if __name__ == "__main__":
-    print(f"Starting Uvicorn server...")
-    print(f"Project Root: {project_root}")
-    print(f"Looking for .env at: {dotenv_path_local}")
-    print(f"Looking for schema at: {schema_path_abs}")
-    uvicorn.run("main:app", host="0.0.0.0", port=8050, reload=True) 
\ No newline at end of file
+    logger.info("Starting Uvicorn server...")
+    logger.info("Project Root: %s", project_root)
+    logger.info("Looking for .env at: %s", dotenv_path_local)
+    logger.info("Looking for schema at: %s", schema_path_abs)
+    # uvloop is not available on Windows: use winloop's policy there ("none" stops uvicorn
+    # overriding it), or the default asyncio loop if winloop isn't installed
+    if sys.platform != "win32":
+        event_loop = "uvloop"
+    else:
+        event_loop = "none" if WINLOOP_INSTALLED else "asyncio"
+    # Worker processes (each has its own driver, router and caches); reload only works with one
+    workers = int(os.getenv("UVICORN_WORKERS", "1"))
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8050,
+        reload=workers == 1,
+        workers=workers,
+        backlog=2048,
+        loop=event_loop,
+        http="httptools",
+        ws="websockets",
+        # Trusted analytic stream: allow large result frames, keep dead peers detectable
+        ws_max_size=16 * 1024 * 1024,
+        ws_max_queue=128,
+        ws_ping_interval=20.0,
+        ws_ping_timeout=20.0,
+        # Each client gets its own stream, so per-connection deflate only burns CPU
+        ws_per_message_deflate=False,
+    )
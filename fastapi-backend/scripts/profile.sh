@@ -0,0 +1,31 @@
+#!/usr/bin/env bash
+# Profiles the backend under real traffic (developer use only; see fastapi-backend/README.md).
+#
+#   scripts/profile.sh scalene   # run the server under Scalene, write profile.html on exit
+#   scripts/profile.sh py-spy    # sample an already running uvicorn for 60s, write profile.svg
+#
+# Requires: scalene>=1.5 / py-spy>=0.3.14 (not in requirements.txt; install them separately).
+set -euo pipefail
+
+cd "$(dirname "$0")/.."
+mode="${1:-scalene}"
+
+case "$mode" in
+  scalene)
+    # Async-aware CPU + memory profile; single worker, no reload, so the profile covers the server
+    exec scalene --cli --profile-all --outfile profile.html \
+      -m uvicorn main:app --host 0.0.0.0 --port 8050 --loop uvloop --http httptools --ws websockets
+    ;;
+  py-spy)
+    pid="$(pgrep -f 'uvicorn|main.py' | head -n 1)"
+    if [ -z "$pid" ]; then
+      echo "No running uvicorn process found." >&2
+      exit 1
+    fi
+    exec py-spy record -o profile.svg --pid "$pid" --subprocesses --duration "${DURATION:-60}"
+    ;;
+  *)
+    echo "Usage: $0 [scalene|py-spy]" >&2
+    exit 2
+    ;;
+esac
@@ -1,13 +1,20 @@
 from .classifier import ClassifierAgent
-from .insight_query_generator import InsightQueryGeneratorAgent
-from .insight_generator import InsightGeneratorAgent
-from .optimization_query_generator import OptimizationQueryGeneratorAgent
-from .optimization_generator import OptimizationRecommendationGeneratorAgent
+from .insight_query_generator import InsightQueryGeneratorAgent, get_insight_query_generator_agent
+from .insight_generator import InsightGeneratorAgent, get_insight_generator_agent
+from .optimization_query_generator import OptimizationQueryGeneratorAgent, get_optimization_query_generator_agent
+from .optimization_generator import OptimizationRecommendationGeneratorAgent, get_optimization_recommendation_agent
+from .graph_generator import GraphGeneratorAgent, get_graph_generator_agent
 
 __all__ = [
     "ClassifierAgent",
     "InsightQueryGeneratorAgent",
+    "get_insight_query_generator_agent",
     "InsightGeneratorAgent",
+    "get_insight_generator_agent",
     "OptimizationQueryGeneratorAgent",
+    "get_optimization_query_generator_agent",
     "OptimizationRecommendationGeneratorAgent",
+    "get_optimization_recommendation_agent",
+    "GraphGeneratorAgent",
+    "get_graph_generator_agent",
 ]
@@ -9,6 +9,7 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.tracers.log_stream import LogEntry
 
 from ..prompts.classifier import create_classifier_prompt
+from ..utils.llm import make_chat_llm
 
 # Ensure OPENAI_API_KEY is set (handled by load_dotenv in utils/neo4j_utils.py or main.py)
 # Consider adding load_dotenv() here if this module might be run independently
@@ -23,7 +24,7 @@ class ClassifierAgent:
     """
     def __init__(self):
         self.prompt: ChatPromptTemplate = create_classifier_prompt()
-        self.llm = ChatOpenAI(
+        self.llm = make_chat_llm(
             model=LLM_MODEL_NAME,
             temperature=0,
             streaming=True, # Still needed for token streaming within log
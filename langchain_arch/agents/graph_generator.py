@@ -1,11 +1,19 @@
 import os
 import json
-from langchain_openai import ChatOpenAI
+import copy
+import logging
+from functools import lru_cache
+from typing import Any, Dict
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 
 from ..prompts.graph_generator import create_graph_generator_prompt
+from ..utils.cache import ResponseCache, make_cache_key, normalize_query
+from ..utils.serialization import prompt_data
+from ..utils.llm import make_chat_llm
+
+logger = logging.getLogger(__name__)
 
 # Configuration (consider making this configurable)
 LLM_MODEL_NAME = "gpt-4o" 
@@ -21,14 +29,14 @@ class GraphGeneratorAgent:
             openai_api_key = os.getenv("OPENAI_API_KEY")
             if not openai_api_key:
                 raise ValueError("OPENAI_API_KEY environment variable not set.")
-            self.llm = ChatOpenAI(
+            self.llm = make_chat_llm(
                 model=LLM_MODEL_NAME,
                 temperature=0.1, # Low temp for predictable JSON output
                 # streaming=False, # No streaming needed for this agent usually
                 model_kwargs={"response_format": {"type": "json_object"}} # Force JSON output
             )
         except Exception as e:
-            print(f"CRITICAL: Failed to initialize LLM in GraphGeneratorAgent: {e}")
+            logger.critical("Failed to initialize LLM in GraphGeneratorAgent: %s", e)
             raise RuntimeError(f"Failed to initialize LLM: {e}") from e
             
         self.prompt: ChatPromptTemplate = create_graph_generator_prompt()
@@ -37,12 +45,41 @@ class GraphGeneratorAgent:
         self.chain = (
             RunnablePassthrough.assign(
                 # Ensure the list of result objects is passed as a JSON string to the prompt
-                data=lambda x: json.dumps(x.get('data', []), indent=2) 
+                # (callers may pass it pre-serialized as `data_json` to share it with other agents)
+                data=prompt_data
             )
             | self.prompt
             | self.llm
             | self.output_parser
         )
+        # Suggestions depend on the question and the shape of each result, not the row values
+        self.suggestion_cache = ResponseCache(max_entries=1024, ttl_seconds=3600)
+
+    @staticmethod
+    def _shape_key(graph_input: Dict[str, Any]) -> str:
+        """Cache key: normalized query plus, per result, its objective, column names and rough row count."""
+        shapes = []
+        for result in graph_input.get("data", []):
+            rows = result.get("data") or []
+            columns = tuple(sorted(rows[0])) if rows and isinstance(rows[0], dict) else ()
+            shapes.append((result.get("objective"), columns, min(len(rows), 2), bool(result.get("error"))))
+        return make_cache_key(normalize_query(graph_input.get("query", "")), shapes)
+
+    async def suggest(self, graph_input: Dict[str, Any]) -> Any:
+        """Runs the chain, reusing the suggestions for a previously seen (query, result shape) pair."""
+        key = self._shape_key(graph_input)
+        cached = self.suggestion_cache.get(key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+        output = await self.chain.ainvoke(graph_input)
+        if isinstance(output, dict) and isinstance(output.get("graph_suggestions"), list):
+            self.suggestion_cache.set(key, copy.deepcopy(output))
+        return output
+
+@lru_cache(maxsize=1)
+def get_graph_generator_agent() -> GraphGeneratorAgent:
+    """Shared GraphGeneratorAgent; the chain is immutable after construction, so one instance serves every request."""
+    return GraphGeneratorAgent()
 
 # Example usage (for testing - requires .env)
 if __name__ == '__main__':
@@ -1,5 +1,6 @@
 import os
 import json
+from functools import lru_cache
 from typing import Dict, Any, AsyncIterator, List
 
 from langchain_openai import ChatOpenAI
@@ -9,6 +10,8 @@ from langchain.output_parsers import OutputFixingParser
 from langchain_core.prompts import ChatPromptTemplate
 
 from ..prompts.insight_generator import create_insight_generator_prompt
+from ..utils.serialization import prompt_data
+from ..utils.llm import make_chat_llm
 
 # Configuration
 LLM_MODEL_NAME = "gpt-4o"
@@ -20,7 +23,7 @@ class InsightGeneratorAgent:
     """
     def __init__(self):
         self.prompt: ChatPromptTemplate = create_insight_generator_prompt()
-        self.llm = ChatOpenAI(
+        self.llm = make_chat_llm(
             model=LLM_MODEL_NAME,
             temperature=0.1,
             streaming=True,
@@ -35,13 +38,18 @@ class InsightGeneratorAgent:
         # Update the chain to use the fixing parser
         self.chain = (
             RunnablePassthrough.assign(
-                data=lambda x: json.dumps(x['data'], indent=2)
+                data=prompt_data # Uses a pre-serialized `data_json` when the caller provides one
             )
             | self.prompt
             | self.llm
             | self.output_parser
         )
 
+@lru_cache(maxsize=1)
+def get_insight_generator_agent() -> InsightGeneratorAgent:
+    """Shared InsightGeneratorAgent; the chain is immutable after construction, so one instance serves every request."""
+    return InsightGeneratorAgent()
+
 # Example usage (for testing - requires .env)
 if __name__ == '__main__':
     import os
@@ -1,58 +1,116 @@
+import asyncio
 import os
 import json
+from functools import lru_cache
 import re
-from typing import Dict, Any, AsyncIterator, Union
+from typing import Dict, Any, Union
 
 from langchain_openai import ChatOpenAI
 from langchain_core.runnables import RunnableConfig, RunnablePassthrough
-from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.tracers.log_stream import LogEntry
 from langchain_core.messages import BaseMessage
 
-from ..prompts.insight_query_generator import create_insight_query_generator_prompt
+from ..prompts.insight_query_generator import (
+    INSIGHT_QUERY_PROMPT,
+    INSIGHT_QUERY_BATCH_PROMPT,
+    INSIGHT_QUERY_PLANNER_PROMPT,
+    INSIGHT_QUERY_RESPONSE_FORMAT,
+    INSIGHT_QUERY_BATCH_RESPONSE_FORMAT,
+)
+from ..utils.llm import make_chat_llm
+from ..utils.output_parsers import FastJsonOutputParser
 
 # Configuration
 LLM_MODEL_NAME = "gpt-4o"
+# Cheaper/faster model for simple single-entity asks (e.g. "top 5 campaigns by cost")
+FAST_LLM_MODEL_NAME = os.getenv("INSIGHT_QUERY_FAST_MODEL", "gpt-4o-mini")
+
+# Signals that a query needs multiple queries, comparisons or time-series reasoning
+_COMPLEX_QUERY_RE = re.compile(
+    r"\b(compare|comparison|versus|vs\.?|trend|trends|over time|growth|change|correlat\w*|why|breakdown|distribution|each|per|week over week|month over month)\b",
+    re.IGNORECASE,
+)
+_ENTITY_RE = re.compile(r"\b(ad ?accounts?|campaigns?|ad ?groups?|ads|keywords?|audiences?|metrics?)\b", re.IGNORECASE)
+_MAX_SIMPLE_QUERY_WORDS = 20
+
+# Fan-out: plan sub-objectives with the fast model, then generate each one's Cypher in parallel
+FANOUT_ENABLED = os.getenv("INSIGHT_QUERY_FANOUT", "false").lower() in ("1", "true", "yes")
+FANOUT_MAX_OBJECTIVES = 5
+_fanout_semaphore = asyncio.Semaphore(int(os.getenv("INSIGHT_QUERY_FANOUT_CONCURRENCY", "8")))
+
+def _classify_complexity(query: str) -> str:
+    """Returns "simple" for short single-entity asks and "complex" otherwise (cheap heuristics, no LLM call)."""
+    if len(query.split()) > _MAX_SIMPLE_QUERY_WORDS or _COMPLEX_QUERY_RE.search(query):
+        return "complex"
+    entities = {m.lower().rstrip("s").replace(" ", "") for m in _ENTITY_RE.findall(query)}
+    return "complex" if len(entities) > 1 else "simple"
 
 class InsightQueryGeneratorAgent:
     """
     Agent that generates Cypher queries based on user query and graph schema.
-    Uses LangChain's built-in streaming (.astream_log).
+    Callers stream `chain` directly (.astream yields the partially parsed JSON).
     """
     def __init__(self):
-        self.prompt: ChatPromptTemplate = create_insight_query_generator_prompt()
-        self.llm = ChatOpenAI(
+        self.prompt: ChatPromptTemplate = INSIGHT_QUERY_PROMPT
+        # Shared by both query chains; InsightWorkflow validates the last streamed object with it
+        self.output_parser = FastJsonOutputParser(required_list_keys=("queries",))
+        self.llm = make_chat_llm(
             model=LLM_MODEL_NAME,
             temperature=0,
+            # Token streaming so InsightWorkflow can surface each query as soon as it is complete.
+            # Streamed calls report no token usage, so prompt_cache_usage is not attached here.
             streaming=True,
         )
         self.chain = (
             RunnablePassthrough.assign(schema=lambda x: x['schema'])
             | self.prompt
-            | self.llm
-            | JsonOutputParser()
+            # Structured outputs guarantee the shape; the parser only does (partial) JSON decoding
+            | self.llm.bind(response_format=INSIGHT_QUERY_RESPONSE_FORMAT)
+            | self.output_parser
+        )
+        # Same pipeline on the fast model, for queries _classify_complexity() deems simple
+        self.llm_fast = make_chat_llm(
+            model=FAST_LLM_MODEL_NAME,
+            temperature=0,
+            streaming=True,
         )
+        self.fast_chain = self.prompt | self.llm_fast.bind(response_format=INSIGHT_QUERY_RESPONSE_FORMAT) | self.output_parser
+        self.planner_chain = INSIGHT_QUERY_PLANNER_PROMPT.partial(max_objectives=str(FANOUT_MAX_OBJECTIVES)) | self.llm_fast.bind(response_format={"type": "json_object"}) | FastJsonOutputParser()
+        # Several numbered user queries -> {"results": [{"id", "queries", "reasoning"}, ...]}
+        self.batch_chain = INSIGHT_QUERY_BATCH_PROMPT | self.llm.bind(response_format=INSIGHT_QUERY_BATCH_RESPONSE_FORMAT) | FastJsonOutputParser(required_list_keys=("results",))
 
-    async def run(self, query: str, schema: str) -> AsyncIterator[LogEntry]:
-        """
-        Executes the Cypher query generation chain using astream_log.
+    def chain_for(self, query: str):
+        """Picks the fast-model chain for simple queries and the gpt-4o chain for everything else."""
+        return self.fast_chain if _classify_complexity(query) == "simple" else self.chain
 
-        Args:
-            query: The user's natural language query.
-            schema: The Neo4j graph schema in Markdown format.
+    async def _generate_objective(self, objective: str, schema: str) -> Dict[str, Any]:
+        async with _fanout_semaphore:
+            return await self.chain_for(objective).ainvoke({"query": objective, "schema": schema})
 
-        Yields:
-            LogEntry objects representing the execution log stream.
+    async def generate_fanout(self, query: str, schema: str) -> Dict[str, Any]:
         """
-        input_data = {"query": query, "schema": schema}
-        # Use astream_log
-        async for chunk in self.chain.astream_log(
-            input_data,
-            include_names=["ChatOpenAI", "JsonOutputParser"],
-            include_types=["llm", "parser"]
-        ):
-            yield chunk
+        Plans independent sub-objectives for `query` and generates their queries concurrently.
+
+        Falls back to a single call when the planner returns one objective (or nothing
+        usable). Returns the same {"queries": [...], "reasoning": ...} shape as `chain`.
+        """
+        plan = await self.planner_chain.ainvoke({"query": query, "schema": schema})
+        objectives = [o for o in (plan.get("objectives") if isinstance(plan, dict) else None) or [] if isinstance(o, str) and o.strip()]
+        if len(objectives) <= 1:
+            return await self.chain_for(query).ainvoke({"query": query, "schema": schema})
+        outputs = await asyncio.gather(*(self._generate_objective(o, schema) for o in objectives[:FANOUT_MAX_OBJECTIVES]))
+        queries, reasoning = [], []
+        for i, (objective, output) in enumerate(zip(objectives, outputs), 1):
+            if not isinstance(output, dict):
+                continue
+            queries.extend(output.get("queries") or [])
+            reasoning.append(f"Objective {i}: {objective}\n{output.get('reasoning', 'N/A')}")
+        return {"queries": queries, "reasoning": "\n\n".join(reasoning) or "N/A"}
+
+@lru_cache(maxsize=1)
+def get_insight_query_generator_agent() -> InsightQueryGeneratorAgent:
+    """Shared InsightQueryGeneratorAgent; the chain is immutable after construction, so one instance serves every workflow."""
+    return InsightQueryGeneratorAgent()
 
 # Example usage (for testing - requires .env, schema)
 if __name__ == '__main__':
@@ -95,14 +153,10 @@ if __name__ == '__main__':
         print(f"--- Using Schema (first 200 chars): ---\n{schema_content[:200]}...\n---")
 
         final_result = None
-        log_entries = []
         try:
-            async for entry in agent.run(query=test_query, schema=schema_content):
-                print(f"Log Entry: {entry}") # Print each LogEntry
-                log_entries.append(entry)
-                # Check for the final output from the parser
-                if entry.name == "JsonOutputParser" and entry.state == "end":
-                    final_result = entry.data.get('output')
+            async for partial in agent.chain.astream({"query": test_query, "schema": schema_content}):
+                print(f"Partial: {partial}") # Print each partially parsed output
+                final_result = partial # The last chunk is the complete parsed output
         except Exception as e:
             print(f"An error occurred during agent execution: {e}")
 
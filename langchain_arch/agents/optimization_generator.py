@@ -1,5 +1,6 @@
 import os
 import json
+from functools import lru_cache
 import asyncio
 from typing import Dict, Any, AsyncIterator, List
 
@@ -10,6 +11,8 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.tracers.log_stream import LogEntry
 
 from ..prompts.optimization_generator import create_optimization_generator_prompt
+from ..utils.serialization import prompt_data
+from ..utils.llm import make_chat_llm
 
 # Configuration
 LLM_MODEL_NAME = "gpt-4o"
@@ -21,14 +24,14 @@ class OptimizationRecommendationGeneratorAgent:
     """
     def __init__(self):
         self.prompt: ChatPromptTemplate = create_optimization_generator_prompt()
-        self.llm = ChatOpenAI(
+        self.llm = make_chat_llm(
             model=LLM_MODEL_NAME,
             temperature=0.1,
             streaming=True,
         )
         self.chain = (
             RunnablePassthrough.assign(
-                data=lambda x: json.dumps(x['data'], indent=2)
+                data=prompt_data # Uses a pre-serialized `data_json` when the caller provides one
             )
             | self.prompt
             | self.llm
@@ -57,6 +60,11 @@ class OptimizationRecommendationGeneratorAgent:
         ):
             yield chunk
 
+@lru_cache(maxsize=1)
+def get_optimization_recommendation_agent() -> OptimizationRecommendationGeneratorAgent:
+    """Shared OptimizationRecommendationGeneratorAgent; the chain is immutable after construction, so one instance serves every request."""
+    return OptimizationRecommendationGeneratorAgent()
+
 # Example usage (for testing - requires .env)
 if __name__ == '__main__':
     import os
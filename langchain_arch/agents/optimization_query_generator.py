@@ -1,5 +1,6 @@
 import os
 import json
+from functools import lru_cache
 import asyncio
 from typing import Dict, Any, AsyncIterator
 
@@ -10,6 +11,8 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.tracers.log_stream import LogEntry
 
 from ..prompts.optimization_query_generator import create_optimization_query_generator_prompt
+from ..utils.callbacks import prompt_cache_usage
+from ..utils.llm import make_chat_llm
 
 # Configuration
 LLM_MODEL_NAME = "gpt-4o"
@@ -17,14 +20,17 @@ LLM_MODEL_NAME = "gpt-4o"
 class OptimizationQueryGeneratorAgent:
     """
     Agent that decomposes optimization request and generates multiple Cypher queries.
-    Uses LangChain's built-in streaming (.astream_log).
+    The LLM call is non-streaming (so token usage is reported); OptimizationWorkflow
+    awaits `chain.ainvoke`, and `run` yields the astream_log entries in one piece.
     """
     def __init__(self):
         self.prompt: ChatPromptTemplate = create_optimization_query_generator_prompt()
-        self.llm = ChatOpenAI(
+        self.llm = make_chat_llm(
             model=LLM_MODEL_NAME,
             temperature=0,
-            streaming=True,
+            # Non-streaming so OpenAI returns token usage (incl. prompt-cache hits) for logging
+            streaming=False,
+            callbacks=[prompt_cache_usage],
         )
         self.chain = (
             RunnablePassthrough.assign(schema=lambda x: x['schema'])
@@ -37,6 +43,8 @@ class OptimizationQueryGeneratorAgent:
         """
         Executes the optimization query generation chain using astream_log.
 
+        The LLM does not stream tokens, so its output arrives as a single log entry.
+
         Args:
             query: The user's natural language optimization request.
             schema: The Neo4j graph schema in Markdown format.
@@ -53,6 +61,11 @@ class OptimizationQueryGeneratorAgent:
         ):
             yield chunk
 
+@lru_cache(maxsize=1)
+def get_optimization_query_generator_agent() -> OptimizationQueryGeneratorAgent:
+    """Shared OptimizationQueryGeneratorAgent; the chain is immutable after construction, so one instance serves every workflow."""
+    return OptimizationQueryGeneratorAgent()
+
 # Example usage (for testing - requires .env, schema)
 if __name__ == '__main__':
     import os
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+from langchain_core.exceptions import OutputParserException
+
+from ..agents.insight_query_generator import InsightQueryGeneratorAgent, get_insight_query_generator_agent
+
+logger = logging.getLogger(__name__)
+
+# Micro-batching of insight query generation (disabled unless INSIGHT_QUERY_BATCH_SIZE > 1)
+INSIGHT_QUERY_BATCH_SIZE = int(os.getenv("INSIGHT_QUERY_BATCH_SIZE", "1"))
+INSIGHT_QUERY_BATCH_WAIT_MS = float(os.getenv("INSIGHT_QUERY_BATCH_WAIT_MS", "50"))
+INSIGHT_QUERY_BATCH_CONCURRENCY = int(os.getenv("INSIGHT_QUERY_BATCH_CONCURRENCY", "4"))
+
+# (user query, schema, caller's future)
+_Pending = Tuple[str, str, asyncio.Future]
+
+class InsightQueryBatcher:
+    """
+    Collects concurrent insight query-generation requests into one LLM call.
+
+    A background task takes up to `max_batch_size` queued requests (waiting at most
+    `max_wait` seconds after the first), groups them by schema and sends each group
+    as a numbered list through the agent's batch chain, so the long shared
+    system prompt + schema prefix is paid once per batch. Results are matched back
+    to each caller by id. At most `max_concurrency` batch calls run at once.
+    """
+    def __init__(self, agent: InsightQueryGeneratorAgent, max_batch_size: int, max_wait: float, max_concurrency: int):
+        self.agent = agent
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: "asyncio.Queue[_Pending]" = asyncio.Queue()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._collector = None
+        self._dispatches = set() # Strong refs to in-flight batch tasks
+
+    async def submit(self, query: str, schema: str) -> Dict[str, Any]:
+        """Queues one request and returns its {"queries": [...], "reasoning": ...} result."""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((query, schema, future))
+        if self._collector is None or self._collector.done():
+            self._collector = asyncio.create_task(self._collect())
+        return await future
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch: List[_Pending] = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size and (timeout := deadline - loop.time()) > 0:
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError: # Not the builtin TimeoutError before 3.11
+                    break
+            by_schema: Dict[str, List[_Pending]] = defaultdict(list)
+            for item in batch:
+                by_schema[item[1]].append(item)
+            for schema, items in by_schema.items():
+                await self._semaphore.acquire()
+                task = asyncio.create_task(self._dispatch(schema, items))
+                self._dispatches.add(task)
+                task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, schema: str, items: List[_Pending]) -> None:
+        try:
+            if len(items) == 1:
+                query, _, future = items[0]
+                result = await self.agent.chain_for(query).ainvoke({"query": query, "schema": schema})
+                if not future.done():
+                    future.set_result(result)
+                return
+            numbered = "\n".join(f"{i}. {query}" for i, (query, _, _) in enumerate(items, 1))
+            logger.info("Generating insight queries for a batch of %s user queries.", len(items))
+            output = await self.agent.batch_chain.ainvoke({"queries": numbered, "schema": schema})
+            results = output.get("results") if isinstance(output, dict) else None
+            by_id = {r.get("id"): r for r in results or [] if isinstance(r, dict)}
+            for i, (_, _, future) in enumerate(items, 1):
+                if future.done(): # Caller went away
+                    continue
+                if (result := by_id.get(i)) is None:
+                    future.set_exception(OutputParserException(f"Batched query generator output has no result for query {i}."))
+                else:
+                    future.set_result({"queries": result.get("queries", []), "reasoning": result.get("reasoning", "N/A")})
+        except Exception as e:
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._semaphore.release()
+
+@lru_cache(maxsize=1)
+def get_insight_query_batcher() -> InsightQueryBatcher:
+    """Shared batcher, so concurrent workflows land in the same batches."""
+    return InsightQueryBatcher(
+        get_insight_query_generator_agent(),
+        max_batch_size=INSIGHT_QUERY_BATCH_SIZE,
+        max_wait=INSIGHT_QUERY_BATCH_WAIT_MS / 1000,
+        max_concurrency=INSIGHT_QUERY_BATCH_CONCURRENCY,
+    )
@@ -1,6 +1,10 @@
 import asyncio
 import json
-from typing import Dict, Any, AsyncIterator, List, Union
+import hashlib
+import logging
+import traceback
+from functools import lru_cache
+from typing import Dict, Any, AsyncIterator, List, Optional, Union
 from langchain_core.exceptions import OutputParserException
 # Import neo4j time types and standard datetime
 from neo4j.time import Date, DateTime, Time 
@@ -9,10 +13,45 @@ from datetime import date, datetime, time
 from langchain_core.tracers.log_stream import RunLogPatch
 from langchain_openai import ChatOpenAI
 
-from ..agents.insight_query_generator import InsightQueryGeneratorAgent
+from ..agents.insight_query_generator import FANOUT_ENABLED, get_insight_query_generator_agent
 from ..agents.insight_generator import InsightGeneratorAgent
+from ..utils.cache import ResponseCache, make_cache_key, normalize_query
+from .insight_query_batcher import INSIGHT_QUERY_BATCH_SIZE, get_insight_query_batcher
 from ..utils.neo4j_utils import Neo4jDatabase
 import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# Serializes cold schema loads so concurrent first runs don't each hit the DB utility/file
+_schema_lock = asyncio.Lock()
+
+# Constant events, built once and yielded as-is. Consumers only read/serialize them (the router
+# copies before caching), so they must never be mutated.
+_STATUS_WORKFLOW_START = {"type": "status", "step": "insight_workflow_start", "status": "in_progress"}
+_STATUS_LOAD_SCHEMA_IN_PROGRESS = {"type": "status", "step": "load_schema", "status": "in_progress", "details": "Loading schema for insight query generation..."}
+_STATUS_LOAD_SCHEMA_COMPLETED = {"type": "status", "step": "load_schema", "status": "completed", "details": "Schema loaded."}
+_STATUS_GENERATE_IN_PROGRESS = {"type": "status", "step": "generate_queries", "status": "in_progress", "details": "Generating Cypher query(s)..."}
+_STATUS_GENERATE_NO_QUERIES = {"type": "status", "step": "generate_queries", "status": "completed", "details": "Insight generation determined no specific Cypher queries are required for this query.", "generated_queries": []}
+_FINAL_INSIGHT_NO_QUERIES = {"type": "final_insight", "summary": "Based on your query, no specific data retrieval is needed to provide an insight.", "results": [], "requires_execution": False}
+_STATUS_WORKFLOW_END = {"type": "status", "step": "insight_workflow_end", "status": "finished_generation"}
+
+# Small talk / acknowledgements that never need data: answered without classifier or query-generation LLM calls
+_TRIVIAL_QUERY_RE = re.compile(
+    r"(hi|hello|hey|yo|hiya|good (morning|afternoon|evening)|thanks?( you)?( so much)?|thx|ty|ok(ay)?|cool|great|nice|got it|bye|goodbye|test(ing)?)"
+    r"( there| again| everyone)?[\s!.,?:)]*",
+    re.IGNORECASE,
+)
+
+def is_trivial_query(user_query: str) -> bool:
+    """True for empty/punctuation-only input and plain greetings or thanks."""
+    text = user_query.strip()
+    return not any(c.isalnum() for c in text) or _TRIVIAL_QUERY_RE.fullmatch(text) is not None
+
+@lru_cache(maxsize=8)
+def _schema_hash(schema: str) -> str:
+    """Short content hash of the schema, so cached queries never outlive a schema change."""
+    return hashlib.sha256(schema.encode("utf-8")).hexdigest()[:16]
 
 class InsightWorkflow:
     """
@@ -20,33 +59,48 @@ class InsightWorkflow:
     Yields RunLogPatch chunks from agents and custom status/error dicts.
     Gets final agent results via separate ainvoke calls after streaming.
     """
-    def __init__(self, neo4j_db: Neo4jDatabase, schema_file: str):
+    def __init__(self, neo4j_db: Neo4jDatabase, schema_file: str, schema_text: Optional[str] = None):
         # Store DB connection and schema file path (may not be strictly needed anymore if agent loads schema)
         self.neo4j_db = neo4j_db
         self.schema_file = schema_file
+        # Pre-loaded schema contents (e.g. read once at app startup); skips the file read per run
+        self.schema_text = schema_text
         # self._schema_content = None # Removed as schema loading is likely internal to agent
+        # Generated queries + reasoning by (schema hash, normalized query); generation is temperature=0
+        self.query_cache = ResponseCache(max_entries=1024, ttl_seconds=3600)
 
-        # Initialize the agent needed for this workflow.
-        # The agent likely initializes its own LLM and loads schema internally.
+        # Get the (process-wide, shared) agent needed for this workflow.
         try:
-            self.insight_query_gen_agent = InsightQueryGeneratorAgent()
-            # TODO: Verify if InsightQueryGeneratorAgent needs any arguments.
+            self.insight_query_gen_agent = get_insight_query_generator_agent()
         except Exception as e:
              # Handle initialization error appropriately
-             print(f"CRITICAL: Failed to initialize InsightQueryGeneratorAgent in InsightWorkflow: {e}")
+             logger.critical("Failed to initialize InsightQueryGeneratorAgent in InsightWorkflow: %s", e)
              raise RuntimeError(f"Failed to initialize agent: {e}") from e
 
     # Put schema loading back, it's needed for the agent's chain input
     def _load_schema(self) -> str:
-        """Loads schema content using the provided Neo4jDatabase instance."""
+        """Returns the pre-loaded schema text, or the schema file contents (cached by Neo4jDatabase)."""
+        if self.schema_text is not None:
+            return self.schema_text
         # Use the passed neo4j_db instance to load schema
-        # No caching needed here as it's called once per run
         content = self.neo4j_db.get_schema_markdown(self.schema_file)
         if content is None:
             # Raise a more specific error if schema loading fails
             raise FileNotFoundError(f"Schema file '{self.schema_file}' could not be loaded by Neo4jDatabase.")
         return content
 
+    async def _aload_schema(self) -> str:
+        """Loads the schema without blocking the event loop (worker thread, one cold load at a time)."""
+        if self.schema_text is not None:
+            return self.schema_text # Pre-loaded: no thread hop or lock needed
+        async with _schema_lock:
+            return await asyncio.to_thread(self._load_schema)
+
+    @staticmethod
+    def _partial_query_event(index: int, query: str) -> Dict[str, Any]:
+        """Event for one fully generated query, sent while the rest of the response is still streaming."""
+        return {"type": "partial_query", "step": "generate_queries", "index": index, "objective": f"Insight Query {index+1}", "query": query}
+
     def _convert_temporal_types(self, data: List[Dict]) -> List[Dict]:
         """Converts Neo4j temporal types in query results to ISO strings."""
         processed_data = []
@@ -64,28 +118,65 @@ class InsightWorkflow:
         return processed_data
 
     async def run(self, user_query: str) -> AsyncIterator[Union[RunLogPatch, Dict[str, Any]]]:
-        yield {"type": "status", "step": "insight_workflow_start", "status": "in_progress"}
+        yield _STATUS_WORKFLOW_START
         generated_queries = []
         query_gen_final_data = None
         insight_gen_final_data = None
 
         try:
+            if is_trivial_query(user_query):
+                # Nothing to query: skip schema loading and the LLM round trip (the Router also
+                # skips classification for these)
+                yield _STATUS_GENERATE_NO_QUERIES
+                yield _FINAL_INSIGHT_NO_QUERIES
+                return
+
             # --- Step 1: Load Schema (Needed for Agent Input) ---
-            yield {"type": "status", "step": "load_schema", "status": "in_progress", "details": "Loading schema for insight query generation..."}
+            yield _STATUS_LOAD_SCHEMA_IN_PROGRESS
             try:
-                schema_content = self._load_schema()
-                yield {"type": "status", "step": "load_schema", "status": "completed", "details": "Schema loaded."}
+                schema_content = await self._aload_schema()
+                yield _STATUS_LOAD_SCHEMA_COMPLETED
             except Exception as e:
                  yield {"type": "error", "step": "load_schema", "message": f"Failed to load schema: {e}"}
                  return
 
             # --- Step 2: Generate Queries (Standardized Name) ---
-            yield {"type": "status", "step": "generate_queries", "status": "in_progress", "details": "Generating Cypher query(s)..."}
+            yield _STATUS_GENERATE_IN_PROGRESS
             
             try:
-                # Invoke the agent's chain. 
-                # Pass the user query AND the loaded schema.
-                query_gen_final_data = await self.insight_query_gen_agent.chain.ainvoke({"query": user_query, "schema": schema_content})
+                # Stream the agent's chain: JsonOutputParser yields the partially parsed object as
+                # tokens arrive, so each query is surfaced as soon as it is complete instead of
+                # after the whole response. Pass the user query AND the loaded schema.
+                queries_sent = 0
+                cache_key = make_cache_key(_schema_hash(schema_content), normalize_query(user_query))
+                if (cached := self.query_cache.get(cache_key)) is not None:
+                    # Same ask against the same schema recently: reuse the generated queries
+                    query_gen_final_data = cached
+                    queries_sent = len(cached.get("queries") or [])
+                elif FANOUT_ENABLED:
+                    # Planner + one parallel call per sub-objective; no partial results to stream
+                    query_gen_final_data = await self.insight_query_gen_agent.generate_fanout(user_query, schema_content)
+                    queries_sent = len(query_gen_final_data.get("queries") or []) if isinstance(query_gen_final_data, dict) else 0
+                elif INSIGHT_QUERY_BATCH_SIZE > 1:
+                    # Micro-batched with concurrent requests: one call, no partial results to stream
+                    query_gen_final_data = await get_insight_query_batcher().submit(user_query, schema_content)
+                    queries_sent = len(query_gen_final_data.get("queries") or []) if isinstance(query_gen_final_data, dict) else 0
+                else:
+                    async for partial in self.insight_query_gen_agent.chain_for(user_query).astream({"query": user_query, "schema": schema_content}):
+                        query_gen_final_data = partial
+                        partial_queries = partial.get("queries") if isinstance(partial, dict) else None
+                        if not isinstance(partial_queries, list):
+                            continue
+                        # The last string may still be growing; earlier ones are final
+                        while queries_sent < len(partial_queries) - 1:
+                            yield self._partial_query_event(queries_sent, partial_queries[queries_sent])
+                            queries_sent += 1
+                    # Partial parses skip the parser's final checks; run them on the last object
+                    self.insight_query_gen_agent.output_parser.validate(query_gen_final_data)
+                # Stream finished: the remaining (last) query is complete too
+                if isinstance(query_gen_final_data, dict) and isinstance(final_queries := query_gen_final_data.get("queries"), list):
+                    for i in range(queries_sent, len(final_queries)):
+                        yield self._partial_query_event(i, final_queries[i])
             except OutputParserException as ope:
                  # Use standardized step name in error
                  yield {"type": "error", "step": "generate_queries", "status": "failed", "message": f"Failed to parse query generator output: {ope}"}
@@ -99,14 +190,15 @@ class InsightWorkflow:
             if not isinstance(query_gen_final_data, dict) or "queries" not in query_gen_final_data:
                  yield {"type": "error", "step": "generate_queries", "status": "failed", "message": f"Query generator returned invalid final output format: {query_gen_final_data}"}
                  return
+            self.query_cache.set(cache_key, query_gen_final_data)
 
             generated_queries_list = query_gen_final_data.get("queries", [])
             
             # Handle case where no queries are generated
             if not generated_queries_list:
-                 yield {"type": "status", "step": "generate_queries", "status": "completed", "details": "Insight generation determined no specific Cypher queries are required for this query.", "generated_queries": []}
+                 yield _STATUS_GENERATE_NO_QUERIES
                  # Send a final message indicating this. 
-                 yield {"type": "final_insight", "summary": "Based on your query, no specific data retrieval is needed to provide an insight.", "results": [], "requires_execution": False}
+                 yield _FINAL_INSIGHT_NO_QUERIES
                  return
 
             # Map the list of strings to the expected frontend format
@@ -135,19 +227,18 @@ class InsightWorkflow:
                  }
 
             # --- Workflow Ends Here (as per standardization) ---
-            print("InsightWorkflow finished: Queries generated.")
+            logger.info("InsightWorkflow finished: Queries generated.")
 
             # REMOVED: Step 3: Execute Cypher Queries Concurrently 
             # REMOVED: Step 3.5: Pre-process results for JSON serialization
             # REMOVED: Step 4: Generate Insight using ainvoke
 
         except Exception as e:
+            logger.exception("Insight Workflow Error")
             yield {"type": "error", "step": "workflow_exception", "message": f"Insight Workflow Error: {e}"}
-            import traceback
-            traceback.print_exc()
         finally:
             # Yield a workflow end status
-            yield {"type": "status", "step": "insight_workflow_end", "status": "finished_generation"}
+            yield _STATUS_WORKFLOW_END
 
 # Example usage (for testing)
 if __name__ == '__main__':
@@ -179,7 +270,6 @@ if __name__ == '__main__':
             print(f"Config Error: {ve}")
         except Exception as e:
             print(f"Workflow failed: {e}")
-            import traceback
             traceback.print_exc()
 
     asyncio.run(main())
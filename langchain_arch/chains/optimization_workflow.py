@@ -1,13 +1,14 @@
 import asyncio
 import json
-from typing import Dict, Any, AsyncIterator, List, Union, AsyncGenerator
+import logging
+from typing import Dict, Any, AsyncIterator, List, Optional, Union, AsyncGenerator
 
 # Import RunLogPatch instead of LogEntry
 from langchain_core.tracers.log_stream import RunLogPatch
 # Import the missing exception
 from langchain_core.exceptions import OutputParserException
 
-from ..agents.optimization_query_generator import OptimizationQueryGeneratorAgent
+from ..agents.optimization_query_generator import get_optimization_query_generator_agent
 # Recommendation generator is no longer called here
 # from ..agents.optimization_generator import OptimizationRecommendationGeneratorAgent
 from ..utils.neo4j_utils import Neo4jDatabase # Still needed for schema loading
@@ -15,6 +16,8 @@ from ..utils.neo4j_utils import Neo4jDatabase # Still needed for schema loading
 from langchain_openai import ChatOpenAI
 import os
 
+logger = logging.getLogger(__name__)
+
 class OptimizationWorkflow:
     """
     Orchestrates the optimization query generation part of the workflow.
@@ -22,24 +25,26 @@ class OptimizationWorkflow:
     Delegates execution and final recommendation generation to the caller.
     """
     # Update __init__ to match how Router calls it
-    def __init__(self, neo4j_db: Neo4jDatabase, schema_file: str):
+    def __init__(self, neo4j_db: Neo4jDatabase, schema_file: str, schema_text: Optional[str] = None):
         # Store DB connection and schema file path (may not be needed if agent handles internally)
         self.neo4j_db = neo4j_db
         self.schema_file = schema_file
+        # Pre-loaded schema contents (e.g. read once at app startup); skips the file read per run
+        self.schema_text = schema_text
         # self._schema_content = None # Removed as schema loading is likely internal to agent
 
-        # Initialize the agent needed for this workflow.
-        # Agent likely initializes its own LLM and loads schema internally.
+        # Get the (process-wide, shared) agent needed for this workflow.
         try:
-            self.query_generator = OptimizationQueryGeneratorAgent()
-            # TODO: Verify if OptimizationQueryGeneratorAgent needs arguments.
+            self.query_generator = get_optimization_query_generator_agent()
         except Exception as e:
-             print(f"CRITICAL: Failed to initialize OptimizationQueryGeneratorAgent in OptimizationWorkflow: {e}")
+             logger.critical("Failed to initialize OptimizationQueryGeneratorAgent in OptimizationWorkflow: %s", e)
              raise RuntimeError(f"Failed to initialize agent: {e}") from e
 
     # Put schema loading back, it's needed for the agent's chain input
     def _load_schema(self) -> str:
-        """Loads schema content using the provided Neo4jDatabase instance."""
+        """Returns the pre-loaded schema text, or loads it using the provided Neo4jDatabase instance."""
+        if self.schema_text is not None:
+            return self.schema_text
         # Use the passed neo4j_db instance to load schema
         content = self.neo4j_db.get_schema_markdown(self.schema_file)
         if content is None:
@@ -121,12 +126,11 @@ class OptimizationWorkflow:
             # --- Workflow Ends Here ---
             # Execution and Recommendation steps are removed.
             # Backend will handle execution and calling OptimizationRecommendationGeneratorAgent
-            print("OptimizationWorkflow finished: Queries generated.")
+            logger.info("OptimizationWorkflow finished: Queries generated.")
 
         except Exception as e:
+            logger.exception("Optimization Workflow Error")
             yield {"type": "error", "step": "workflow_exception", "message": f"Optimization Workflow Error: {e}"}
-            import traceback
-            traceback.print_exc()
         finally:
             # Yield a workflow end status (optional, depends on frontend needs)
             yield {"type": "status", "step": "opt_workflow_end", "status": "finished_generation"}
@@ -1,13 +1,24 @@
 import asyncio
 import json
-from typing import Dict, Any, AsyncIterator, Union
+import logging
+import traceback
+from typing import Dict, Any, AsyncIterator, List, Optional, Union
 
 from langchain_core.tracers.log_stream import RunLogPatch
 
-from .insight_workflow import InsightWorkflow
+from .insight_workflow import InsightWorkflow, is_trivial_query
 from .optimization_workflow import OptimizationWorkflow
 from ..agents.classifier import ClassifierAgent
-from ..utils.neo4j_utils import Neo4jDatabase
+from ..utils.neo4j_utils import get_database, close_database
+from ..utils.cache import ResponseCache, make_cache_key, normalize_query
+
+logger = logging.getLogger(__name__)
+
+# Workflow classes by classifier label; one instance of each is built per Router and reused
+WORKFLOW_CLASSES = {
+    "insight": InsightWorkflow,
+    "optimization": OptimizationWorkflow,
+}
 
 class Router:
     """
@@ -16,95 +27,168 @@ class Router:
     streaming RunLogPatch objects and custom status dicts.
     Gets final agent results via separate ainvoke calls after streaming.
     """
-    def __init__(self, schema_file: str = "neo4j_schema.md"):
-        # Initialize DB connection per Router instance.
-        # Ensures connection is managed if Router is long-lived.
+    def __init__(self, schema_file: str = "neo4j_schema.md", response_cache: Optional[ResponseCache] = None, schema_text: Optional[str] = None):
+        # Shared process-wide DB connection (see get_database), fetched on first use
         self._db_connection = None
         self.schema_file = schema_file
+        # Optional pre-loaded schema contents, handed to every workflow instead of re-reading the file
+        self.schema_text = schema_text
         self.classifier = ClassifierAgent()
-        # Workflow instantiation moved to run() to ensure they get the active DB connection
+        # Exact-match cache of full chunk streams for repeated queries (classifier + query generation)
+        self.response_cache = response_cache if response_cache is not None else ResponseCache()
+        # Classifier results by normalized query; classification is deterministic (temperature=0)
+        self.classifier_cache = ResponseCache(max_entries=4096, ttl_seconds=600)
+        # Workflows are stateless between runs, so they are built once (lazily or via warm_up)
+        # and share the router's long-lived DB connection
+        self._workflows: Dict[str, Any] = {}
 
     def _get_db(self):
-        """Creates or returns the active DB connection for this router instance."""
+        """Returns the shared DB connection, creating it on first use."""
         if self._db_connection is None:
-            # Add error handling for DB connection failure if needed
-            self._db_connection = Neo4jDatabase()
+            self._db_connection = get_database()
         return self._db_connection
 
-    def _close_db(self):
-        """Closes the DB connection if it exists."""
-        if self._db_connection:
-            try:
-                self._db_connection.close()
-                # print("Router: DB connection closed.")
-            except Exception as e:
-                print(f"Router: Error closing DB: {e}")
-            finally:
-                self._db_connection = None
-
-    async def run(self, user_query: str) -> AsyncIterator[Union[RunLogPatch, Dict[str, Any]]]:
+    def _get_workflow(self, workflow_type: str):
+        """Returns the cached workflow instance for `workflow_type`, building it on first use."""
+        workflow = self._workflows.get(workflow_type)
+        if workflow is None:
+            workflow_cls = WORKFLOW_CLASSES.get(workflow_type)
+            if workflow_cls is None:
+                return None
+            workflow = workflow_cls(self._get_db(), self.schema_file, schema_text=self.schema_text)
+            self._workflows[workflow_type] = workflow
+        return workflow
+
+    def cache_stats(self) -> Dict[str, int]:
+        """Hit/miss counters for the response and classifier caches."""
+        return {
+            "response_hits": self.response_cache.hits,
+            "response_misses": self.response_cache.misses,
+            "classifier_hits": self.classifier_cache.hits,
+            "classifier_misses": self.classifier_cache.misses,
+        }
+
+    def warm_up(self):
+        """Opens the DB connection and builds every workflow ahead of the first request."""
+        for workflow_type in WORKFLOW_CLASSES:
+            self._get_workflow(workflow_type)
+
+    def close(self):
+        """Drops cached workflows and this router's reference to the shared DB connection.
+
+        The connection itself is process-wide (see get_database) and may still be used by
+        other routers; it is closed once by close_database() at app shutdown or interpreter exit.
+        """
+        self._workflows.clear()
+        self._db_connection = None
+
+    async def run(self, user_query: str, workflow_type: Optional[str] = None) -> AsyncIterator[Union[RunLogPatch, Dict[str, Any]]]:
+        """
+        Streams the routed workflow for `user_query`, replaying a cached stream when the
+        same (normalized) query was answered recently. Only runs that finished without
+        any error chunk are cached.
+
+        If `workflow_type` names a known workflow, classification is skipped and that
+        workflow is used directly.
         """
-        Runs classification and the selected workflow, streaming RunLogPatch and status dicts.
-        Manages Neo4j connection lifecycle for the run.
+        if workflow_type not in WORKFLOW_CLASSES:
+            workflow_type = None # Unknown/absent override: classify as usual
+        cache_key = make_cache_key(normalize_query(user_query), self.schema_file, workflow_type)
+        cached_chunks = self.response_cache.get(cache_key)
+        if cached_chunks is not None:
+            for chunk in cached_chunks:
+                # Hand out copies so consumers can't mutate the cached entry
+                yield dict(chunk)
+            return
+
+        recorded: List[Dict[str, Any]] = []
+        cacheable = True
+        async for chunk in self._run_uncached(user_query, workflow_type):
+            if isinstance(chunk, dict):
+                if chunk.get("type") == "error":
+                    cacheable = False
+                recorded.append(dict(chunk))
+            else:
+                cacheable = False # Only plain dict streams can be replayed
+            yield chunk
+        if cacheable:
+            self.response_cache.set(cache_key, recorded)
+
+    async def _classify(self, user_query: str) -> Dict[str, Any]:
+        """Runs the classifier, reusing a recent result for the same normalized query."""
+        key = make_cache_key(normalize_query(user_query))
+        classification_output = self.classifier_cache.get(key)
+        if classification_output is None:
+            classification_output = await self.classifier.chain.ainvoke({"query": user_query})
+            if isinstance(classification_output, dict) and "workflow" in classification_output:
+                self.classifier_cache.set(key, classification_output)
+        return classification_output
+
+    async def _run_uncached(self, user_query: str, workflow_type: Optional[str] = None) -> AsyncIterator[Union[RunLogPatch, Dict[str, Any]]]:
+        """
+        Runs classification (unless `workflow_type` is given) and the selected workflow,
+        streaming RunLogPatch and status dicts.
+        The DB connection and workflow instances outlive the run (see close()).
         """
         yield {"type": "status", "step": "start_router", "status": "in_progress", "details": "Initializing..."}
 
         classification_output = None
-        db = self._get_db()
 
         try:
             # --- Step 1: Classify Query using ainvoke --- 
-            yield {"type": "status", "step": "classify_query", "status": "in_progress", "details": "Classifying query..."}
-            
-            try:
-                # Invoke directly to get final result
-                classification_output = await self.classifier.chain.ainvoke({"query": user_query})
-            except Exception as class_err:
-                 yield {"type": "error", "step": "classify_query", "status": "failed", "message": f"Failed to get classification result: {class_err}"}
-                 self._close_db()
-                 return
-
-            if not isinstance(classification_output, dict) or "workflow" not in classification_output:
-                 yield {"type": "error", "step": "classify_query", "status": "failed", "message": f"Classifier returned invalid final output: {classification_output}"}
-                 self._close_db()
-                 return
-
-            # Yield final classification result AND the routing decision
-            workflow_type = classification_output.get("workflow")
-            # Yield classification details first
-            yield {"type": "status", "step": "classify_query", "status": "completed", "details": f"Query classified for '{workflow_type}' workflow.", "classification_details": classification_output}
+            if workflow_type is not None:
+                # Caller already chose the workflow; no classifier round trip needed
+                classification_output = {"workflow": workflow_type, "reasoning": "Workflow type provided by the caller."}
+                yield {"type": "status", "step": "classify_query", "status": "skipped", "details": f"Using requested '{workflow_type}' workflow.", "classification_details": classification_output}
+            elif is_trivial_query(user_query):
+                # Greetings/thanks never need data: the insight workflow answers them without any
+                # LLM call, so don't spend one on classification either
+                workflow_type = "insight"
+                classification_output = {"workflow": workflow_type, "reasoning": "Greeting or acknowledgement; no data needed."}
+                yield {"type": "status", "step": "classify_query", "status": "skipped", "details": "No data needed for this message.", "classification_details": classification_output}
+            else:
+                yield {"type": "status", "step": "classify_query", "status": "in_progress", "details": "Classifying query..."}
+                
+                try:
+                    # Invoke directly to get final result (cached per normalized query)
+                    classification_output = await self._classify(user_query)
+                except Exception as class_err:
+                     yield {"type": "error", "step": "classify_query", "status": "failed", "message": f"Failed to get classification result: {class_err}"}
+                     return
+
+                if not isinstance(classification_output, dict) or "workflow" not in classification_output:
+                     yield {"type": "error", "step": "classify_query", "status": "failed", "message": f"Classifier returned invalid final output: {classification_output}"}
+                     return
+
+                # Yield final classification result AND the routing decision
+                workflow_type = classification_output.get("workflow")
+                # Yield classification details first
+                yield {"type": "status", "step": "classify_query", "status": "completed", "details": f"Query classified for '{workflow_type}' workflow.", "classification_details": classification_output}
             # Yield the crucial routing decision message for the backend handler
             yield {"type": "routing_decision", "workflow_type": workflow_type}
 
             # --- Step 2: Route to Workflow --- 
             yield {"type": "status", "step": "route_workflow", "status": "in_progress", "details": f"Routing to '{workflow_type}' workflow."}
 
-            if workflow_type == "insight":
-                insight_workflow = InsightWorkflow(db, self.schema_file)
-                # The workflow's run method will now handle streaming its agents' logs
-                # and yielding its own status/final dicts
-                async for workflow_chunk in insight_workflow.run(user_query):
-                    yield workflow_chunk
-            elif workflow_type == "optimization":
-                optimization_workflow = OptimizationWorkflow(db, self.schema_file)
-                async for workflow_chunk in optimization_workflow.run(user_query):
-                    yield workflow_chunk
-            else:
+            workflow = self._workflows.get(workflow_type)
+            if workflow is None and workflow_type in WORKFLOW_CLASSES:
+                # First use (no warm_up): connecting to Neo4j and building agents is blocking
+                # work, so do it in a worker thread rather than on the event loop
+                workflow = await asyncio.to_thread(self._get_workflow, workflow_type)
+            if workflow is None:
                 yield {"type": "error", "step": "route_workflow", "message": f"Unknown workflow type: {workflow_type}"}
-                # No need to close DB here, finally block handles it
                 return
+            # The workflow's run method handles streaming its agents' logs
+            # and yielding its own status/final dicts
+            async for workflow_chunk in workflow.run(user_query):
+                yield workflow_chunk
             
             # Workflow completion status is now yielded by the workflow itself
             # yield {"type": "status", "step": "workflow_complete", "status": "completed", "details": f"'{workflow_type}' workflow finished."}
 
         except Exception as e:
+             logger.exception("Router Error")
              yield {"type": "error", "step": "router_exception", "message": f"Router Error: {e}"}
-             import traceback
-             traceback.print_exc()
-        finally:
-            self._close_db()
-            # Yield final status AFTER closing DB is safer if needed, but generally not required
-            # yield {"type": "status", "step": "end_router", "status": "finished"}
 
 # Example usage (for testing)
 if __name__ == '__main__':
@@ -132,7 +216,6 @@ if __name__ == '__main__':
                     print(f"OTHER: {result_chunk}")
         except Exception as e:
             print(f"Insight test failed: {e}")
-            import traceback
             traceback.print_exc()
 
         # Create a new router instance for the second test to ensure clean DB handling
@@ -149,7 +232,10 @@ if __name__ == '__main__':
                      print(f"OTHER: {result_chunk}")
         except Exception as e:
             print(f"Optimization test failed: {e}")
-            import traceback
             traceback.print_exc()
+        finally:
+            router.close()
+            router_opt.close()
+            close_database()
 
     asyncio.run(main_test())
@@ -1,90 +1,171 @@
+import json
+import os
+import re
+
+from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
 
 INSIGHT_QUERY_SYSTEM_PROMPT = """
-You are a highly specialized and accurate Cypher query generator for a Neo4j graph database, expertly crafting queries specifically for generating data-driven insights based on a provided schema. Your primary directive is **ABSOLUTE STRICT ADHERENCE** to the `Graph Schema` provided.
-
-Graph Schema:
----
-{schema}
----
-
-Core Function: Translate user natural language requests into one or more precise, efficient, and schema-compliant Cypher queries designed to retrieve comprehensive and accurately calculated data for insight generation. This includes relevant comparative data, required metrics (correctly aggregated or calculated), and contextual information from connected entities *as defined by the schema*.
-
-**CRITICAL CONSTRAINTS (Strictly Enforce These First):**
-
-1.  **Schema Compliance:** EVERY node label, relationship type, and property used in the query MUST EXACTLY match the provided `Graph Schema`. Never assume the existence of nodes, relationships, or properties not explicitly listed.
-2.  **Hierarchy Requirement:** ALL query paths MUST originate from the `:adaccount` node and traverse downwards through defined relationships. NO queries should start from or involve nodes without a valid, schema-defined path from `:adaccount`.
-3.  **Status Filtering:** For `:Campaign`, `:AdGroup`, and `:Ad` nodes (DONT do this for any other nodes such as AdAccount), ONLY include those with a 'status' property value of 'ENABLED', unless the user specifically requests entities with other statuses (e.g., PAUSED, REMOVED) or requests analysis of non-enabled entities (e.g., 'all campaigns', 'disabled ads').
-4.  **Campaign Serving Status Filtering:** For `:Campaign` node alone, ONLY include those with a 'serving_status' property value of 'SERVING', unless the user specifically requests entities with other serving statuses (e.g., 'all campaigns'). Not for any other nodes.
-5.  **Metric Value Filtering:** Exclude results where core performance metrics (clicks, impressions, cost, conversions - identify specific property names from schema) are null or zero, UNLESS the user explicitly asks for low or zero performance (e.g., 'bottom performers', 'entities with no clicks'). Apply this filter using `WHERE` clauses *after* aggregation if summing metrics.
-6.  **Metric Type Usage:** Use overall/aggregated metrics (SUM) for summaries unless the user explicitly requests analysis based on granular time periods (daily, weekly, monthly). If granular analysis is requested, use specific metric nodes/properties *only if they exist and are clearly defined in the schema* for those granularities.
-7.  **Limiting return results:** If the user does not specify a limit, return at most 10 results.
-8.  **No conversion needed:** All the metrics such as cost_micros, cost, impressions, clicks, etc. have already been converted to dollars in the query results.
-9.  **No duplicate aliases:** The output query should not have duplicate aliases for the different metrics. No two columns should have the same alias.
-10.  **No status filtering for other nodes:** Do not apply status filtering to any other nodes such as AdAccount.
-
-**Instructions:**
-
-1.  **Analyze Request & Intent:** Fully understand the user's request, identifying the core entities (e.g., campaigns, ads), the primary metrics involved (explicitly mentioned or implied for ranking/comparison like 'best', 'top', 'worst'), and the desired scope (overall, specific date range - use parameters, granular).
-2.  **Schema Verification & Element Identification:** Based on the analysis and *strictly consulting the `Graph Schema`*:
-    * Identify the exact node labels, relationship types, and property names needed.
-    * Identify all relevant performance metric properties available in the schema for the core entities. Include metrics that enable standard calculations (like clicks, impressions, cost, conversions) even if not explicitly named by the user, *provided they exist in the schema*.
-    * Identify relevant properties on directly connected contextual nodes *as defined by the schema* (e.g., `adaccount.name`, `campaign.name`, `adgroup.id`).
-3.  **Construct Cypher Query(s):**
-    * Write clear, syntactically correct Cypher queries.
-    * **Apply Constraints:** Implement the Hierarchy (start from `:adaccount`), Status Filtering (`WHERE entity.status = 'ENABLED'`) (Not for AdAccount), and Metric Value Filtering (`WHERE aggregatedMetric > 0` or similar) constraints using schema-verified property names.
-    * **Aggregation & Calculation:**
-        * Aggregate metrics using `SUM()` when calculating totals or overall figures per entity.
-        * Calculate derived metrics (e.g., CTR, CPC, CVR) *ONLY IF* the required base metric properties (clicks, impressions, cost, conversions - using their EXACT schema names) exist on the entity or associated metric node after aggregation.
-        * Use standard formulas:
-            * CTR: `toFloat(SUM(clicks_property)) / SUM(impressions_property)`
-            * CPC: `toFloat(SUM(cost_property)) / SUM(clicks_property)` (Cost is already in dollars in the query results)
-            * CVR: `toFloat(SUM(conversions_property)) / SUM(clicks_property)` or `toFloat(SUM(conversions_property)) / SUM(impressions_property)` (Choose based on common definition or implied user need)
-        * Use `CASE WHEN SUM(denominator_property) > 0 THEN ... ELSE 0 END` to prevent division by zero.
-    * **Ranking & Context:** If ranking is requested ('top', 'best', 'bottom'), order by the relevant metric and use `LIMIT`. Provide at least the top 5 results by default, or the number requested by the user. Include identifying information (name, ID) and all retrieved/calculated metrics for comparison.
-    * **Parameters:** Use parameters (`$param_name`) for values like IDs, dates, limits.
-    * **Optimization:** Write queries that are efficient and readable.
-    * **Multiple Queries:** If the user request is complex and involves distinct information sets, generate multiple independent queries.
-4.  **RETURN Clause:** The RETURN clause MUST provide rich, accurately calculated/aggregated, and contextual data.
-    * Use meaningful, descriptive aliases for all returned values.
-    * **CRITICAL: Ensure ABSOLUTELY UNIQUE Column Names/Aliases.** Every single alias used in the `RETURN` clause MUST be distinct. Double-check that no alias is repeated.
-    * **Handling Similar Metrics:** If multiple related metrics exist in the schema (e.g., `conversions` and `all_conversions`, or `conversions_value` and `all_conversions_value`), you MUST assign them unique and descriptive aliases. For example, use `conversionsSpecific` and `conversionsAll`, or `convValueSpecific` and `convValueAll`. Alternatively, if the user query implies a total summary, preferentially return the most comprehensive metric (like `all_conversions`) with a clear alias and omit the less comprehensive one *if* it prevents alias collision. Do NOT return multiple fields with the exact same alias.
-    * Include identifying properties from related contextual nodes (like campaign name for an ad).
-
-5.  **Reasoning Requirements:**
-    * Explicitly state how the user's request was interpreted.
-    * Justify the selection of nodes, relationships, and properties by referencing the `Graph Schema`.
-    * Explain how each constraint (Hierarchy, Status, Metric Value Filter) was applied.
-    * Detail how metrics were aggregated (`SUM()`) and *exactly* how derived metrics were calculated, showing the formula used and confirming that the necessary base metric properties (by their schema name) exist.
-    * Explain why specific contextual data was included.
-
-6.  **Output Format:** Respond *only* in **valid** JSON format with two keys:
-    *   `"queries"`: A list of strings, where each string is a valid Cypher query. Use actual newline characters (`\n`) for line breaks. **No backslashes (`\`) for line continuation.**
-    *   `"reasoning"`: A step-by-step explanation. **Crucially, justify *how* metrics were aggregated or calculated** (e.g., "Calculated overall CTR as SUM(clicks)/SUM(impressions) after aggregation") and why additional context was included.
-
-**Example Input Query:** "What is the overall CTR and CPC for my top 3 campaigns by cost?"
-
-**Example Output (Illustrating Calculation - Assuming Schema Supports This):**
-```json
-{{
-  "queries": [
-    "MATCH (c:Campaign)-[:HAS_METRIC]->(m:Metric)\\nWHERE m.entity_type = 'Campaign' // Assuming Campaign-level metrics exist\\nWITH c, SUM(m.campaign_metric_cost_micros) AS totalCostMicros, SUM(m.campaign_metric_clicks) AS totalClicks, SUM(m.campaign_metric_impressions) AS totalImpressions\\nORDER BY totalCostMicros DESC\\nLIMIT 3\\nRETURN \\n  c.name AS campaignName, \\n  totalCostMicros, \\n  totalClicks, \\n  totalImpressions, \\n  CASE WHEN totalImpressions > 0 THEN toFloat(totalClicks) / totalImpressions ELSE 0 END AS overallCTR, \\n  CASE WHEN totalClicks > 0 THEN toFloat(totalCostMicros) / totalClicks ELSE 0 END AS overallCPC"
-  ],
-  "reasoning": "1. **Analyze Request & Intent:** User wants overall CTR and CPC for the top 3 campaigns ranked by total cost.\\n2. **Identify Elements:** Need `Campaign` nodes and associated `Metric` nodes with cost, clicks, and impressions.\\n3. **Construct Query & Calculation Rationale:**\\n   - Matched Campaign to its Metrics.\\n   - Aggregated cost, clicks, and impressions using `SUM()` per campaign (`WITH c`).\\n   - Ordered by `totalCostMicros` DESC and took the `LIMIT 3` for the top spenders.\\n   - **Calculated Metrics:** Calculated `overallCTR` in the RETURN clause as `toFloat(totalClicks) / totalImpressions` and `overallCPC` as `toFloat(totalCostMicros) / totalClicks`, using `CASE` statements to prevent division by zero. This ensures accurate calculation of the ratios based on the aggregated totals.\\n   - Returned campaign name and all relevant aggregated/calculated metrics."
-}}
-```
-
-**Important Reminders:**
-*   Base queries *strictly* on the provided schema.
-*   If the schema lacks metrics needed for calculation, state this and return what's possible.
-*   Focus on gathering accurately calculated data; insight synthesis happens next.
+You generate Cypher queries for a Neo4j graph database that retrieve accurately calculated data for insight generation. **ABSOLUTE STRICT ADHERENCE** to the `Graph Schema` (next system message) is your primary directive.
+
+Task: turn the user's request into one or more precise, efficient, schema-compliant Cypher queries returning the required metrics (correctly aggregated/calculated), relevant comparative data, and context from connected entities *as defined by the schema*.
+
+**CRITICAL CONSTRAINTS:**
+1. **Schema compliance:** Every label, relationship type and property MUST exactly match the schema. Never assume anything not listed.
+2. **Hierarchy:** Every query path MUST start at `:adaccount` and traverse down schema-defined relationships.
+3. **Status filtering:** Only for `:Campaign`, `:AdGroup` and `:Ad` (never AdAccount or other nodes): keep `status = 'ENABLED'`. For `:Campaign` only, also keep `serving_status = 'SERVING'`. Skip these filters when the user asks for other statuses or all entities (e.g. 'all campaigns', 'paused', 'disabled ads').
+4. **Metric value filtering:** Exclude results whose core metrics (clicks, impressions, cost, conversions; exact schema names) are null or zero, unless the user asks for low/zero performance. When summing, filter with `WHERE` *after* aggregation.
+5. **Metric granularity:** Use overall SUM aggregates unless daily/weekly/monthly analysis is requested and the schema clearly defines those metrics.
+6. **Limit:** If the user gives no limit, return at most 10 results.
+7. **No unit conversion:** cost/cost_micros and other metrics are already in dollars in the results.
+8. **Unique aliases:** No two RETURN columns may share an alias.
+9. **Temporal values:** Wrap returned date/datetime/time properties in `toString()` (e.g. `toString(m.date) AS metricDate`).
+
+**Query construction:**
+- Identify entities, metrics (explicit or implied by 'top', 'best', 'worst') and scope; take exact names from the schema. Include schema metrics that enable standard calculations (clicks, impressions, cost, conversions) and contextual properties of connected nodes (e.g. `adaccount.name`, `campaign.name`, `adgroup.id`).
+- Aggregate totals with `SUM()`. Derive metrics only when their base properties exist: CTR = `toFloat(SUM(clicks)) / SUM(impressions)`; CPC = `toFloat(SUM(cost)) / SUM(clicks)`; CVR = `toFloat(SUM(conversions)) / SUM(clicks)` (or / impressions if implied). Guard denominators with `CASE WHEN ... > 0 THEN ... ELSE 0 END`.
+- Ranking: order by the relevant metric with `LIMIT` (the user's number, default top 5-10) and return identifying info (name, ID) plus all retrieved/calculated metrics.
+- Use parameters (`$param_name`) for IDs, dates and limits. Keep queries efficient and readable. Use multiple independent queries for distinct information sets.
+- RETURN rich, contextual data with descriptive aliases. Give similar metrics distinct aliases (e.g. `conversionsSpecific` vs `conversionsAll`) or return only the most comprehensive one.
+
+**Reasoning:** state how the request was interpreted; justify nodes, relationships and properties from the schema; explain how each constraint (hierarchy, status, metric filter) was applied; show exactly how metrics were aggregated and derived (formula and schema property names); explain the included context.
+
+**Output:** `queries` (one Cypher string per query) and `reasoning` (the explanation above).
 
+If the schema lacks metrics needed for a calculation, say so and return what is possible. Insight synthesis happens in a later step.
 """
-INSIGHT_QUERY_HUMAN_PROMPT = "User Query: {query}\n\nGenerate the Cypher query(s) and reasoning based on the schema provided in the system prompt."
+# Worked example, sent as a Human/AI message pair only when INSIGHT_QUERY_FEWSHOT is enabled. Plain
+# messages (not templates), so the JSON needs no brace escaping
+FEWSHOT_ENABLED = os.getenv("INSIGHT_QUERY_FEWSHOT", "false").lower() in ("1", "true", "yes")
+INSIGHT_QUERY_FEWSHOT_QUERY = "User Query: What is the overall CTR and CPC for my top 3 campaigns by cost?"
+INSIGHT_QUERY_FEWSHOT_OUTPUT = json.dumps({
+    "queries": [
+        "MATCH (a:AdAccount)-[:HAS_CAMPAIGN]->(c:Campaign)-[:HAS_OVERALL_METRICS]->(m:CampaignOverallMetric)\n"
+        "WHERE c.status = 'ENABLED' AND c.serving_status = 'SERVING'\n"
+        "WITH a, c, SUM(m.cost_micros) AS totalCost, SUM(m.clicks) AS totalClicks, SUM(m.impressions) AS totalImpressions\n"
+        "WHERE totalCost > 0\n"
+        "ORDER BY totalCost DESC\n"
+        "LIMIT 3\n"
+        "RETURN a.name AS accountName, c.name AS campaignName, totalCost, totalClicks, totalImpressions,\n"
+        "  CASE WHEN totalImpressions > 0 THEN toFloat(totalClicks) / totalImpressions ELSE 0 END AS overallCTR,\n"
+        "  CASE WHEN totalClicks > 0 THEN toFloat(totalCost) / totalClicks ELSE 0 END AS overallCPC"
+    ],
+    "reasoning": "1. Interpreted as overall CTR and CPC for the 3 campaigns with the highest total cost.\n"
+                 "2. Path AdAccount -> Campaign -> CampaignOverallMetric; enabled, serving campaigns only.\n"
+                 "3. Summed cost, clicks and impressions per campaign, dropped zero-cost campaigns after aggregation, ordered by cost with LIMIT 3.\n"
+                 "4. CTR = clicks / impressions and CPC = cost / clicks on the aggregated totals, guarded with CASE against division by zero.",
+})
+
+# Kept out of INSIGHT_QUERY_SYSTEM_PROMPT so the invariant rules form a stable, cacheable prefix; a schema
+# change then only invalidates the cache from this message on
+INSIGHT_QUERY_SCHEMA_PROMPT = "Graph Schema:\n---\n{schema}\n---"
+
+INSIGHT_QUERY_HUMAN_PROMPT = "User Query: {query}\n\nGenerate the Cypher query(s) and reasoning based on the schema provided above."
+
+# Several user queries in one call: same system messages (so the same cached prefix), numbered queries in
+# the human message, and one result object per query
+INSIGHT_QUERY_BATCH_HUMAN_PROMPT = """User Queries (answer each one independently):
+{queries}
+
+For EACH numbered query, generate the Cypher query(s) and reasoning based on the schema provided above, following all rules above.
+Return one entry in `results` per numbered query, using its number as `id`."""
+
+# OpenAI structured outputs (strict JSON schema): decoding is constrained to this shape, so the
+# response always parses and the prompt needs no JSON-formatting instructions
+INSIGHT_QUERY_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "CypherQueries",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "queries": {"type": "array", "items": {"type": "string"}},
+                "reasoning": {"type": "string"},
+            },
+            "required": ["queries", "reasoning"],
+            "additionalProperties": False,
+        },
+    },
+}
+INSIGHT_QUERY_BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "BatchedCypherQueries",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "results": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "integer"},
+                            "queries": {"type": "array", "items": {"type": "string"}},
+                            "reasoning": {"type": "string"},
+                        },
+                        "required": ["id", "queries", "reasoning"],
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["results"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+# Cheap planning pass for fan-out: split a request into sub-objectives, each generated in its own call
+INSIGHT_QUERY_PLANNER_SYSTEM_PROMPT = """
+Split the user's ad-performance analytics request into independent sub-objectives, each answerable by ONE Cypher query over the graph schema below.
+- Only split when the request needs distinct information sets (e.g. a comparison of different entity types, or a metric summary plus a trend). Otherwise return the request itself as the single objective.
+- Each objective must be self-contained: restate the entities, metrics, filters, date ranges and limits it needs from the original request.
+- Return at most {max_objectives} objectives.
+Respond *only* with valid JSON: {{"objectives": ["<objective>", ...]}}
+"""
+INSIGHT_QUERY_PLANNER_HUMAN_PROMPT = "User Query: {query}"
+
+def _compact(text: str) -> str:
+    """Collapses blank-line runs so no prefill tokens are spent on layout."""
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+def _system_and_schema_messages() -> list:
+    """Invariant rules (+ optional few-shot pair) first, then the schema: the longest stable prefix for prompt caching."""
+    messages = [SystemMessagePromptTemplate.from_template(_compact(INSIGHT_QUERY_SYSTEM_PROMPT))]
+    if FEWSHOT_ENABLED:
+        messages += [HumanMessage(content=INSIGHT_QUERY_FEWSHOT_QUERY), AIMessage(content=INSIGHT_QUERY_FEWSHOT_OUTPUT)]
+    messages.append(SystemMessagePromptTemplate.from_template(INSIGHT_QUERY_SCHEMA_PROMPT))
+    return messages
 
 def create_insight_query_generator_prompt() -> ChatPromptTemplate:
-    """Creates the ChatPromptTemplate for the InsightQueryGenerator Agent."""
+    """
+    Creates the ChatPromptTemplate for the InsightQueryGenerator Agent.
+
+    Message order is invariant rules -> schema -> user query, so OpenAI's automatic
+    prompt caching can reuse the longest possible prefix across calls.
+    """
     return ChatPromptTemplate.from_messages([
-        SystemMessagePromptTemplate.from_template(INSIGHT_QUERY_SYSTEM_PROMPT),
+        *_system_and_schema_messages(),
         HumanMessagePromptTemplate.from_template(INSIGHT_QUERY_HUMAN_PROMPT)
     ])
+
+def create_insight_query_batch_prompt() -> ChatPromptTemplate:
+    """Creates the ChatPromptTemplate for generating queries for several user queries in one call."""
+    return ChatPromptTemplate.from_messages([
+        *_system_and_schema_messages(),
+        HumanMessagePromptTemplate.from_template(INSIGHT_QUERY_BATCH_HUMAN_PROMPT)
+    ])
+
+def create_insight_query_planner_prompt() -> ChatPromptTemplate:
+    """Creates the ChatPromptTemplate for the fan-out planner (schema after the rules, user query last)."""
+    return ChatPromptTemplate.from_messages([
+        SystemMessagePromptTemplate.from_template(_compact(INSIGHT_QUERY_PLANNER_SYSTEM_PROMPT)),
+        SystemMessagePromptTemplate.from_template(INSIGHT_QUERY_SCHEMA_PROMPT),
+        HumanMessagePromptTemplate.from_template(INSIGHT_QUERY_PLANNER_HUMAN_PROMPT)
+    ])
+
+# Built once at import; ChatPromptTemplates are immutable, so every agent can share them
+INSIGHT_QUERY_PROMPT = create_insight_query_generator_prompt()
+INSIGHT_QUERY_BATCH_PROMPT = create_insight_query_batch_prompt()
+INSIGHT_QUERY_PLANNER_PROMPT = create_insight_query_planner_prompt()
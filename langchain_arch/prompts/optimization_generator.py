@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
 
 # System prompt definition for the Optimization Generator Agent (Consultant Version)
@@ -88,8 +90,9 @@ Your task is to analyze performance data (features) extracted from a Neo4j graph
 
 OPTIMIZATION_GENERATOR_HUMAN_PROMPT = "Original User Request: {query}\n\nExtracted Features Data (Dictionary of Objective -> Results):\n```json\n{data}\n```\n\nGenerate actionable optimization recommendations and reasoning based on the user request and the provided data."
 
+@lru_cache(maxsize=1)
 def create_optimization_generator_prompt() -> ChatPromptTemplate:
-    """Creates the ChatPromptTemplate for the OptimizationRecommendationGenerator Agent."""
+    """Creates the ChatPromptTemplate for the OptimizationRecommendationGenerator Agent (built once; templates are immutable)."""
     return ChatPromptTemplate.from_messages([
         SystemMessagePromptTemplate.from_template(OPTIMIZATION_GENERATOR_SYSTEM_PROMPT),
         HumanMessagePromptTemplate.from_template(OPTIMIZATION_GENERATOR_HUMAN_PROMPT)
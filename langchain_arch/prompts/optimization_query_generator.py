@@ -26,6 +26,7 @@ Core Function: Translate user natural language optimization requests into *multi
 8.  **No Conversion Needed:** Assume that metric properties like `cost_micros`, `cost`, `impressions`, `clicks`, `conversions`, etc., available in the schema, are already in their final, usable unit (e.g., dollars for cost) and do not require conversion (like dividing micros by 1,000,000) unless the schema explicitly indicates otherwise and provides the conversion factor. *Self-correction: The previous version mentioned cost_micros and conversion, which contradicts the "No conversion needed" constraint. I will adjust the examples and instructions to assume metrics are ready to use as per the schema.*
 9.  **Dont restrict to certain date ranges:** The queries should not be restricted to certain date ranges unless the user explicitly requests so. The queries should be able to run for any date range.
 10.  **Dont use arbitrary performance thresholds:** The queries should not be restricted to certain performance thresholds unless the user explicitly requests so. Sort the metrics and get the lowest or highest performers.
+11.  **Temporal values as strings:** When returning date, datetime or time properties, wrap them in `toString()` in the RETURN clause (e.g., `toString(m.date) AS metricDate`) so results come back as ISO strings.
 
 **Instructions:**
 
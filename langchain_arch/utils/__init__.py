@@ -1,9 +1,29 @@
-from .neo4j_utils import Neo4jDatabase
+from .neo4j_utils import Neo4jDatabase, get_database, close_database
+from .cache import ResponseCache, make_cache_key, normalize_query
+from .callbacks import PromptCacheUsageHandler, prompt_cache_usage
+from .serialization import dumps_prompt_data, json_default, prompt_data
+from .output_parsers import FastJsonOutputParser
+from .llm import make_chat_llm, enable_shared_http_async_client, get_shared_http_async_client, close_shared_http_async_client
 # Remove imports from deleted streaming.py
 # from .streaming import AsyncStreamCallbackHandler, generate_stream
 
 __all__ = [
     "Neo4jDatabase",
+    "get_database",
+    "close_database",
+    "ResponseCache",
+    "make_cache_key",
+    "normalize_query",
+    "PromptCacheUsageHandler",
+    "prompt_cache_usage",
+    "dumps_prompt_data",
+    "json_default",
+    "prompt_data",
+    "FastJsonOutputParser",
+    "make_chat_llm",
+    "enable_shared_http_async_client",
+    "get_shared_http_async_client",
+    "close_shared_http_async_client",
     # Remove exports from deleted streaming.py
     # "AsyncStreamCallbackHandler",
     # "generate_stream",
@@ -0,0 +1,58 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+def normalize_query(query: str) -> str:
+    """Lower-cases and collapses whitespace so trivially different asks share a key."""
+    return re.sub(r"\s+", " ", query.strip().lower())
+
+def make_cache_key(*parts: Any) -> str:
+    """Builds a stable SHA-256 key from the given parts (e.g. normalized query, schema file)."""
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    Small in-memory LRU cache with a per-entry TTL.
+
+    Used to replay the output of deterministic (temperature=0) steps for repeated
+    queries instead of calling the LLM and Neo4j again. Exact-match only; entries
+    expire after `ttl_seconds` and the least recently used entry is evicted once
+    `max_entries` is reached. Not shared between processes.
+    """
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Returns the cached value for `key`, or None if missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Stores `value` under `key`, evicting the least recently used entry if full."""
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drops all entries (e.g. after the schema changes)."""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,34 @@
+import logging
+from typing import Any
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+logger = logging.getLogger(__name__)
+
+class PromptCacheUsageHandler(BaseCallbackHandler):
+    """
+    Logs how many prompt tokens OpenAI served from its prompt cache.
+
+    OpenAI caches identical prompt prefixes (>= 1024 tokens) automatically, so the
+    query-generation prompts keep the static instructions and the schema at the
+    start and the user query last. Token usage is only reported for non-streaming
+    calls, so attach it to non-streaming LLMs only (the optimization query generator).
+    """
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        if not prompt_tokens:
+            return # No usage reported (e.g. a streamed call)
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        logger.info("Prompt cache: %s/%s prompt tokens cached (running total %s/%s).",
+                    cached_tokens, prompt_tokens, self.cached_tokens, self.prompt_tokens)
+
+# Shared instance so the running totals cover every query generator
+prompt_cache_usage = PromptCacheUsageHandler()
@@ -0,0 +1,54 @@
+import os
+from functools import lru_cache
+from typing import Any
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+# One keep-alive pool to api.openai.com for every agent in the process
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "50"))
+
+@lru_cache(maxsize=1)
+def get_shared_http_async_client() -> httpx.AsyncClient:
+    """Process-wide async HTTP client, so agents reuse warm TLS connections instead of one pool each."""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        ),
+        timeout=httpx.Timeout(120.0, connect=10.0),
+    )
+
+# Off unless enable_shared_http_async_client() is called: an httpx pool's connections belong
+# to the event loop that opened them, so only a process with one long-lived loop may share it
+_share_http_async_client = False
+
+def enable_shared_http_async_client() -> None:
+    """
+    Makes make_chat_llm() put every LLM on the shared HTTP client.
+
+    Call once at startup, before any agent is built, in processes that run all LLM calls
+    on a single long-lived event loop (the FastAPI backend). Entry points that call
+    asyncio.run() per request (Streamlit) must not enable it.
+    """
+    global _share_http_async_client
+    _share_http_async_client = True
+
+def make_chat_llm(**kwargs: Any) -> ChatOpenAI:
+    """
+    Builds a ChatOpenAI, on the shared HTTP client if enable_shared_http_async_client() ran.
+
+    Agents keep their own model settings (temperature, streaming, callbacks,
+    response_format); only the underlying connection pool is shared. Otherwise each
+    ChatOpenAI gets its own client, as before.
+    """
+    if _share_http_async_client:
+        kwargs.setdefault("http_async_client", get_shared_http_async_client())
+    return ChatOpenAI(**kwargs)
+
+async def close_shared_http_async_client() -> None:
+    """Closes the shared client's connections (call on shutdown)."""
+    if get_shared_http_async_client.cache_info().currsize:
+        await get_shared_http_async_client().aclose()
+        get_shared_http_async_client.cache_clear()
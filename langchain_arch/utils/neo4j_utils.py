@@ -1,11 +1,22 @@
+import atexit
 import os
+import logging
+from functools import lru_cache
 from neo4j import GraphDatabase
 from dotenv import load_dotenv
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Package root (one level up from utils), for schema paths given relative to it
+_PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Schema file contents by resolved path: path -> (st_mtime_ns, text)
+_SCHEMA_CACHE: Dict[str, Tuple[int, str]] = {}
+
 class Neo4jDatabase:
     """
     Utility class for interacting with a Neo4j database.
@@ -29,16 +40,16 @@ class Neo4jDatabase:
         try:
             self._driver = GraphDatabase.driver(uri, auth=(user, password))
             self._driver.verify_connectivity()
-            print(f"Successfully connected to Neo4j database: {self.database} at {uri}")
+            logger.info("Successfully connected to Neo4j database: %s at %s", self.database, uri)
         except Exception as e:
-            print(f"Failed to connect to Neo4j: {e}")
+            logger.error("Failed to connect to Neo4j: %s", e)
             raise
 
     def close(self):
         """Closes the Neo4j driver connection."""
         if self._driver:
             self._driver.close()
-            print("Neo4j connection closed.")
+            logger.info("Neo4j connection closed.")
 
     def query(self, cypher_query: str, params: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """
@@ -55,14 +66,14 @@ class Neo4jDatabase:
         if params is None:
             params = {}
         try:
+            # Sessions are cheap (pooled connections underneath); keep the query text constant
+            # and pass values as params so the server's plan cache can be hit
             with self._driver.session(database=self.database) as session:
                 result = session.run(cypher_query, params)
                 # Consume the result fully and convert records to dictionaries
                 return [record.data() for record in result]
         except Exception as e:
-            print(f"Error executing Cypher query: {e}")
-            print(f"Query: {cypher_query}")
-            print(f"Params: {params}")
+            logger.error("Error executing Cypher query: %s\nQuery: %s\nParams: %s", e, cypher_query, params)
             # Depending on the desired error handling, you might re-raise, return None, or empty list
             return [] # Return empty list on error for now
 
@@ -80,20 +91,27 @@ class Neo4jDatabase:
             # Adjust path relative to the project root if necessary
             # Assuming this script is run from the project root or schema_file_path is absolute
             full_path = os.path.abspath(schema_file_path)
-            if not os.path.exists(full_path):
-                 # Try path relative to this file's directory if not found
-                base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # Go up one level from utils
-                full_path = os.path.join(base_dir, schema_file_path)
-
-
-            if os.path.exists(full_path):
-                 with open(full_path, 'r', encoding='utf-8') as f:
-                    return f.read()
-            else:
-                print(f"Schema file not found at expected paths: {schema_file_path} or {full_path}")
-                return None
+            try:
+                st = os.stat(full_path)
+            except FileNotFoundError:
+                # Try path relative to this file's directory if not found
+                full_path = os.path.join(_PACKAGE_DIR, schema_file_path)
+                try:
+                    st = os.stat(full_path)
+                except FileNotFoundError:
+                    logger.error("Schema file not found at expected paths: %s or %s", schema_file_path, full_path)
+                    return None
+
+            # Unchanged since the last read: one stat call and a dict lookup
+            cached = _SCHEMA_CACHE.get(full_path)
+            if cached is not None and cached[0] == st.st_mtime_ns:
+                return cached[1]
+            with open(full_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            _SCHEMA_CACHE[full_path] = (st.st_mtime_ns, content)
+            return content
         except Exception as e:
-            print(f"Error reading schema file {schema_file_path}: {e}")
+            logger.error("Error reading schema file %s: %s", schema_file_path, e)
             return None
 
     def __enter__(self):
@@ -102,6 +120,25 @@ class Neo4jDatabase:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
+@lru_cache(maxsize=1)
+def get_database() -> Neo4jDatabase:
+    """
+    Process-wide Neo4jDatabase, created on first use.
+
+    The driver owns a connection pool and routing table and is meant to be
+    long-lived, so callers share this instance instead of opening their own.
+    It is closed at interpreter exit unless close_database() ran first.
+    """
+    db = Neo4jDatabase()
+    atexit.register(close_database)
+    return db
+
+def close_database() -> None:
+    """Closes the shared database, if it was created (safe to call more than once)."""
+    if get_database.cache_info().currsize:
+        get_database().close()
+        get_database.cache_clear()
+
 # Example usage (optional, for testing)
 if __name__ == '__main__':
     # Make sure you have a .env file with your Neo4j credentials
@@ -0,0 +1,35 @@
+from typing import Any, List, Tuple
+
+import orjson
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.outputs import Generation
+
+class FastJsonOutputParser(JsonOutputParser):
+    """
+    JsonOutputParser that parses the final output with orjson and checks its shape.
+
+    The complete response is parsed with `orjson.loads`, falling back to the base
+    parser only for non-bare JSON (e.g. wrapped in a ```json fence). Keys listed in
+    `required_list_keys` must be present and hold lists, otherwise an
+    OutputParserException is raised. Partial (streaming) parses are left to the base
+    class, so `.astream()` still yields partially parsed objects; streaming callers
+    pass the last one to `validate()` instead.
+    """
+    required_list_keys: Tuple[str, ...] = ()
+
+    def parse_result(self, result: List[Generation], *, partial: bool = False) -> Any:
+        if partial:
+            return super().parse_result(result, partial=True)
+        try:
+            data = orjson.loads(result[0].text)
+        except orjson.JSONDecodeError:
+            data = super().parse_result(result, partial=False)
+        return self.validate(data)
+
+    def validate(self, data: Any) -> Any:
+        """Checks `required_list_keys` on an already parsed object and returns it."""
+        for key in self.required_list_keys:
+            if not isinstance(data, dict) or not isinstance(data.get(key), list):
+                raise OutputParserException(f"Expected a JSON object with a '{key}' list, got: {str(data)[:200]}")
+        return data
@@ -0,0 +1,20 @@
+from typing import Any, Dict
+
+import orjson
+
+def json_default(value: Any) -> str:
+    """orjson `default=` fallback: ISO strings for (neo4j) temporals and durations, str() for anything else."""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if hasattr(value, "iso_format"): # neo4j.time.Duration
+        return value.iso_format()
+    return str(value)
+
+def dumps_prompt_data(data: Any) -> str:
+    """Serializes query results for a prompt (indented JSON, as the agents always used) with orjson."""
+    return orjson.dumps(data, default=json_default, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
+
+def prompt_data(agent_input: Dict[str, Any]) -> str:
+    """Returns the caller's pre-serialized `data_json` if given, otherwise serializes `data`."""
+    data_json = agent_input.get("data_json")
+    return data_json if data_json is not None else dumps_prompt_data(agent_input.get("data", []))
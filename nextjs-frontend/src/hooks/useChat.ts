@@ -1,4 +1,4 @@
-import { useState, useCallback, useEffect } from 'react';
+import { useState, useCallback, useEffect, useRef } from 'react';
 import useWebSocket, { ReadyState } from 'react-use-websocket';
 
 // Define the structure of a chat message
@@ -24,7 +24,7 @@ export interface QueryResult {
 
 // Define the structure of messages coming FROM the WebSocket
 interface WebSocketMessage {
-    type: string; // 'status', 'reasoning_summary', 'final_insight', 'final_recommendations', 'error', 'generated_queries', 'query_result', 'classifier_answer', 'classifier_info', 'routing_decision', 'graph_suggestions'
+    type: string; // 'status', 'reasoning_summary', 'final_insight', 'final_recommendations', 'error', 'generated_queries', 'query_result', 'classifier_answer', 'classifier_info', 'routing_decision', 'graph_suggestions', 'partial_query'
     // Add fields based on the backend stream types
     step?: string;
     status?: string;
@@ -43,6 +43,9 @@ interface WebSocketMessage {
     content?: string;
     workflow_type?: string;
     classification_details?: Record<string, unknown>; // Changed any to unknown
+    messages?: WebSocketMessage[]; // Present on 'batch' envelopes of coalesced frames
+    seq?: number; // Per-connection sequence number, restarts at 0 on reconnect
+    index?: number; // Position of a 'partial_query' within the generated queries
 }
 
 // Define the specific structure for Graph Suggestions
@@ -82,6 +85,8 @@ export function useChat() {
   const [isProcessing, setIsProcessing] = useState<boolean>(false);
   // State for the graph suggestions (now a list)
   const [graphSuggestions, setGraphSuggestions] = useState<GraphSuggestion[]>([]); // Use the specific interface
+  // Last backend sequence number seen, used to detect dropped frames
+  const lastSeqRef = useRef<number>(-1);
 
   const {
     sendMessage: sendWebSocketMessage,
@@ -102,7 +107,24 @@ export function useChat() {
   useEffect(() => {
     if (lastJsonMessage) {
       console.log('Received WS Message:', lastJsonMessage); // Debugging
-      const { type, step, status } = lastJsonMessage;
+      // Backend coalesces frames queued together into a single 'batch' envelope
+      const incoming = lastJsonMessage.type === 'batch' && lastJsonMessage.messages
+        ? lastJsonMessage.messages
+        : [lastJsonMessage];
+      incoming.forEach(handleMessage);
+    }
+  }, [lastJsonMessage]); // Rerun when a new message arrives
+
+  // Handles a single (unwrapped) backend message
+  function handleMessage(message: WebSocketMessage) {
+      const { type, step, status } = message;
+
+      if (typeof message.seq === 'number') {
+        if (message.seq !== 0 && message.seq !== lastSeqRef.current + 1) {
+          console.warn(`WebSocket gap detected: expected seq ${lastSeqRef.current + 1}, got ${message.seq}`);
+        }
+        lastSeqRef.current = message.seq;
+      }
 
       // Helper to update the most recent milestone message for a given step
       const updateLastMilestone = (stepName: string, updates: Partial<ChatMessage>) => {
@@ -118,7 +140,7 @@ export function useChat() {
       // Handle different message types from backend
       switch (type) {
         case 'status':
-          const statusText = `**${step?.replace(/_/g, ' ')}**: ${status?.replace(/_/g, ' ')}${lastJsonMessage.details ? ` - ${lastJsonMessage.details}` : ''}`;
+          const statusText = `**${step?.replace(/_/g, ' ')}**: ${status?.replace(/_/g, ' ')}${message.details ? ` - ${message.details}` : ''}`;
           setCurrentStatus(statusText); // Overwrite status
 
           // Clear status and processing flag if workflow ends
@@ -133,11 +155,11 @@ export function useChat() {
               let milestoneContent = `✅ ${step?.replace(/_/g, ' ')} Finished`;
               let milestoneQueries: { objective: string; query: string }[] | undefined = undefined;
 
-              if ((step === 'generate_opt_queries' || step === 'generate_cypher') && lastJsonMessage.generated_queries) {
-                   const queryCount = lastJsonMessage.generated_queries.length;
+              if ((step === 'generate_opt_queries' || step === 'generate_cypher') && message.generated_queries) {
+                   const queryCount = message.generated_queries.length;
                    const queryNoun = queryCount === 1 ? 'query' : 'queries';
                    milestoneContent = `✅ Query Generation Finished (${queryCount} ${queryNoun})`;
-                   milestoneQueries = lastJsonMessage.generated_queries; 
+                   milestoneQueries = message.generated_queries; 
               } else if (step === 'execute_opt_queries' || step === 'execute_cypher') {
                   // Also check for insight workflow execution step
                   milestoneContent = `✅ Query Execution Finished`;
@@ -158,9 +180,9 @@ export function useChat() {
           break; // Break after handling normal status/milestones
 
         case 'classifier_info':
-            if (typeof lastJsonMessage.content === 'string' && lastJsonMessage.content.trim() !== '') {
+            if (typeof message.content === 'string' && message.content.trim() !== '') {
                  // --- EDIT: Assign to new variable first ---
-                 const messageContent = lastJsonMessage.content; 
+                 const messageContent = message.content; 
                  setMessages(prev => [...prev, { 
                      id: generateId(), 
                      role: 'assistant', 
@@ -173,9 +195,9 @@ export function useChat() {
             break;
             
         case 'classifier_answer':
-             if (typeof lastJsonMessage.content === 'string' && lastJsonMessage.content.trim() !== '') {
+             if (typeof message.content === 'string' && message.content.trim() !== '') {
                  // --- EDIT: Assign to new variable first ---
-                 const messageContent = lastJsonMessage.content; 
+                 const messageContent = message.content; 
                  setMessages(prev => [...prev, { 
                      id: generateId(), 
                      role: 'assistant', 
@@ -190,19 +212,26 @@ export function useChat() {
             }
             break;
 
+        case 'partial_query':
+          // A query finished generating while the rest of the response is still streaming
+          if (typeof message.index === 'number') {
+            setCurrentStatus(`**generate queries**: in progress - Generated query ${message.index + 1}...`);
+          }
+          break;
+
         case 'reasoning_summary':
           // Add reasoning to the *last* milestone message associated with this step
-          if (step && lastJsonMessage.reasoning) {
-            const reasoningText = `**Reasoning:**\n${lastJsonMessage.reasoning}`; 
+          if (step && message.reasoning) {
+            const reasoningText = `**Reasoning:**\n${message.reasoning}`; 
             updateLastMilestone(step, { reasoning: reasoningText });
           }
           break;
 
         case 'final_insight':
           // Handle final insight message
-          const insightContent = lastJsonMessage.insight || 'No final insight received.';
-          const insightReasoning = lastJsonMessage.reasoning;
-          const insightSuggestions = lastJsonMessage.graph_suggestions || []; // Keep getting suggestions if sent here
+          const insightContent = message.insight || 'No final insight received.';
+          const insightReasoning = message.reasoning;
+          const insightSuggestions = message.graph_suggestions || []; // Keep getting suggestions if sent here
           
           setMessages(prev => [...prev, {
             id: generateId(),
@@ -227,10 +256,10 @@ export function useChat() {
         case 'final_recommendation':
            // Handle final recommendations message
            // Expects report_sections now
-           const reportSections = lastJsonMessage.report_sections;
-           const reportReasoning = lastJsonMessage.reasoning;
+           const reportSections = message.report_sections;
+           const reportReasoning = message.reasoning;
            // Also check for graph suggestions within the final message
-           const suggestions = lastJsonMessage.graph_suggestions;
+           const suggestions = message.graph_suggestions;
            if (suggestions && Array.isArray(suggestions)) {
               console.log("Received graph suggestions within final_recommendation:", suggestions);
               // Cast received data to GraphSuggestion[] before setting state
@@ -259,30 +288,30 @@ export function useChat() {
            break;
 
         case 'graph_suggestions': // This is the primary handler now
-          console.log("Received graph suggestions list:", lastJsonMessage.graph_suggestions);
+          console.log("Received graph suggestions list:", message.graph_suggestions);
           // Cast received data to GraphSuggestion[] before setting state
-          setGraphSuggestions((lastJsonMessage.graph_suggestions || []) as GraphSuggestion[]); // Update state with the list
+          setGraphSuggestions((message.graph_suggestions || []) as GraphSuggestion[]); // Update state with the list
           break;
 
         case 'query_result': 
-           if (lastJsonMessage.objective && lastJsonMessage.query) {
+           if (message.objective && message.query) {
                const newResult: QueryResult = {
-                   objective: lastJsonMessage.objective,
-                   query: lastJsonMessage.query,
-                   dataframe: lastJsonMessage.data,
-                   error: lastJsonMessage.error,
+                   objective: message.objective,
+                   query: message.query,
+                   dataframe: message.data,
+                   error: message.error,
                };
                setQueryResults(prev => [...prev, newResult]); // Update data pane state
            }
            break;
 
         case 'routing_decision': // Handle routing info if needed
-            console.log('Routing decision:', lastJsonMessage);
+            console.log('Routing decision:', message);
             // You could potentially display this info or use workflow_type
             break;
 
         case 'error':
-          const errorMsg = `**Error (${step || 'Unknown Step'}):** ${lastJsonMessage.message}${lastJsonMessage.details ? `\\n\\\`\\\`\\\`\\n${lastJsonMessage.details}\\\`\\\`\\\`` : ''}`;
+          const errorMsg = `**Error (${step || 'Unknown Step'}):** ${message.message}${message.details ? `\\n\\\`\\\`\\\`\\n${message.details}\\\`\\\`\\\`` : ''}`;
           setMessages(prev => [...prev, { id: generateId(), role: 'system', content: errorMsg }]);
           setCurrentStatus(null); 
           setIsProcessing(false); // <<< AND HERE
@@ -291,8 +320,7 @@ export function useChat() {
         default:
           console.warn('Received unknown WebSocket message type:', type);
       }
-    }
-  }, [lastJsonMessage]); // Rerun when a new message arrives
+  }
 
   // --- Send message function --- 
   const sendMessage = useCallback((message: string) => {
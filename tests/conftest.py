@@ -0,0 +1,56 @@
+import asyncio
+import os
+import sys
+
+# The backend validates these at import time; tests never connect to Neo4j or OpenAI
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("NEO4J_URI", "bolt://localhost:7687")
+os.environ.setdefault("NEO4J_USERNAME", "neo4j")
+os.environ.setdefault("NEO4J_PASSWORD", "test")
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+for path in (PROJECT_ROOT, os.path.join(PROJECT_ROOT, "fastapi-backend")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from langchain_arch.utils.output_parsers import FastJsonOutputParser # noqa: E402 (needs the path above)
+
+
+# --- Shared test doubles (import with `from conftest import ...`) ---
+
+class FakeRecord:
+    """neo4j Record stand-in: only data() is used."""
+    def __init__(self, data):
+        self._data = data
+
+    def data(self):
+        return dict(self._data)
+
+
+class FakeChain:
+    """Runnable stand-in: ainvoke() records its inputs and returns respond(inputs); astream() yields `partials`."""
+    def __init__(self, respond=None, partials=()):
+        self.respond = respond
+        self.partials = list(partials)
+        self.calls = []
+
+    async def ainvoke(self, inputs):
+        self.calls.append(inputs)
+        await asyncio.sleep(0)
+        return self.respond(inputs)
+
+    async def astream(self, inputs):
+        self.calls.append(inputs)
+        for partial in self.partials:
+            yield partial
+
+
+class FakeAgent:
+    """InsightQueryGeneratorAgent stand-in: chain_for() always returns `chain`."""
+    def __init__(self, chain=None, batch_chain=None):
+        self.chain = chain
+        self.batch_chain = batch_chain
+        self.output_parser = FastJsonOutputParser(required_list_keys=("queries",))
+
+    def chain_for(self, query):
+        return self.chain
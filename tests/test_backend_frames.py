@@ -0,0 +1,90 @@
+import asyncio
+
+import orjson
+
+import main
+
+
+class RecordingWebSocket:
+    """Collects sent text frames; optionally fails every send."""
+    def __init__(self, fail_sends: bool = False):
+        self.sent = []
+        self.fail_sends = fail_sends
+
+    async def send_text(self, text: str):
+        if self.fail_sends:
+            raise RuntimeError("socket closed")
+        self.sent.append(text)
+
+
+def _unwrap(frames):
+    """Decodes sent frames into a flat message list, unwrapping batch envelopes."""
+    messages = []
+    for frame in frames:
+        payload = orjson.loads(frame)
+        messages.extend(payload["messages"] if payload.get("type") == "batch" else [payload])
+    return messages
+
+
+async def _drain(messages, websocket):
+    out_q = asyncio.Queue()
+    writer = asyncio.create_task(main.websocket_writer(websocket, out_q))
+    for message in messages:
+        out_q.put_nowait(message)
+    await asyncio.wait_for(out_q.join(), 2)
+    return writer
+
+
+def test_writer_replaces_unencodable_message_and_keeps_running():
+    async def scenario():
+        websocket = RecordingWebSocket()
+        # orjson cannot encode integers wider than 64 bits, even with a default= fallback
+        writer = await _drain([{"type": "query_result", "step": "QueryExecution", "data": [{"n": 2**70}]}], websocket)
+        assert not writer.done()
+        await _drain([{"type": "final_insight", "insight": "ok"}], websocket)
+        writer.cancel()
+        return _unwrap(websocket.sent)
+
+    messages = asyncio.run(scenario())
+    assert messages[0]["type"] == "error"
+    assert messages[0]["step"] == "QueryExecution"
+    assert messages[-1]["type"] == "final_insight"
+
+
+def test_writer_stops_when_send_fails():
+    async def scenario():
+        writer = await _drain([{"type": "error", "message": "x"}], RecordingWebSocket(fail_sends=True))
+        await asyncio.wait_for(writer, 1)
+        return writer
+
+    assert asyncio.run(scenario()).exception() is None
+
+
+def test_encode_frame_falls_back_for_neo4j_types():
+    from neo4j.time import DateTime, Duration
+
+    frame = main.encode_frame({"type": "query_result", "data": [{"m": {"created": DateTime(2024, 5, 1, 12, 30, 0)}, "d": Duration(days=2)}]})
+    row = orjson.loads(frame)["data"][0]
+    assert row["m"]["created"].startswith("2024-05-01T12:30:00")
+    assert row["d"] == "P2D"
+
+
+def test_backed_up_queue_sheds_only_progress_statuses():
+    out_q = asyncio.Queue()
+    for _ in range(main.OUTBOUND_SOFT_LIMIT):
+        out_q.put_nowait("{}")
+    main.enqueue_outbound(out_q, {"type": "status", "step": "generate_queries", "status": "in_progress"})
+    main.enqueue_outbound(out_q, main.running_query_frame("Top campaigns", 3))
+    main.enqueue_outbound(out_q, main.status_frame("QueryExecution", "in_progress", 'says "status":"completed"'))
+    assert out_q.qsize() == main.OUTBOUND_SOFT_LIMIT
+
+    terminal = [
+        {"type": "status", "step": "insight_workflow_end", "status": "finished_generation"},
+        {"type": "status", "step": "opt_workflow_end", "status": "completed"},
+        main.status_frame("QueryExecution", "completed", "Finished executing 3 queries."),
+        main.ROUTER_COMPLETED_FRAME,
+        {"type": "query_result", "objective": "o", "query": "q", "data": []},
+    ]
+    for message in terminal:
+        main.enqueue_outbound(out_q, message)
+    assert out_q.qsize() == main.OUTBOUND_SOFT_LIMIT + len(terminal)
@@ -0,0 +1,33 @@
+import asyncio
+from datetime import date
+
+from neo4j.time import Date, DateTime, Duration
+
+import main
+from conftest import FakeRecord
+
+
+def test_to_json_value_converts_temporals_nested_in_maps_and_lists():
+    value = {"created": DateTime(2024, 5, 1, 12, 30, 0), "window": [{"start": Date(2024, 1, 1)}, date(2024, 2, 1)], "ttl": Duration(hours=1), "name": "A"}
+    converted = main._to_json_value(value)
+    assert converted["created"].startswith("2024-05-01T12:30:00")
+    assert converted["window"] == [{"start": "2024-01-01"}, "2024-02-01"]
+    assert converted["ttl"] == "PT1H"
+    assert converted["name"] == "A"
+
+
+class FakeResult:
+    def __init__(self, records):
+        self._records = records
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for record in self._records:
+            yield record
+
+
+def test_records_to_dicts_converts_map_projection_values():
+    result = FakeResult([FakeRecord({"c": {"name": "A", "created": Date(2024, 3, 2)}})])
+    assert asyncio.run(main.records_to_dicts(result)) == [{"c": {"name": "A", "created": "2024-03-02"}}]
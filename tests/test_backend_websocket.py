@@ -0,0 +1,84 @@
+import asyncio
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+class FakeRouter:
+    """Yields a fixed chunk stream that needs no query execution."""
+    def __init__(self, extra_chunks=()):
+        self.extra_chunks = list(extra_chunks)
+
+    async def run(self, user_query, workflow_type=None):
+        yield {"type": "routing_decision", "workflow_type": "insight"}
+        for i in range(3):
+            yield {"type": "status", "step": "generate_queries", "status": "in_progress", "details": f"step {i}"}
+        for chunk in self.extra_chunks:
+            yield chunk
+        yield {"type": "final_insight", "insight": f"answer to {user_query}", "requires_execution": False}
+
+    def cache_stats(self):
+        return {}
+
+
+@pytest.fixture
+def connect(monkeypatch):
+    def _connect(router):
+        components = main.Components(router=router, read_session=None, llm=None, workflow_semaphore=asyncio.Semaphore(1))
+        monkeypatch.setitem(main.app_state, "components", components)
+        # No `with TestClient(...)`: startup (Neo4j, LLM) is never run
+        return TestClient(main.app).websocket_connect("/api/v1/chat/stream")
+    return _connect
+
+
+def _receive_run(ws):
+    """Reads frames until the run's closing final_insight; returns (raw frame payloads, unwrapped messages)."""
+    frames, messages = [], []
+    router_completed = False
+    while True:
+        payload = orjson.loads(ws.receive_text())
+        frames.append(payload)
+        for message in payload["messages"] if payload.get("type") == "batch" else [payload]:
+            messages.append(message)
+            router_completed = router_completed or message.get("status") == "router_completed"
+            if router_completed and message.get("type") == "final_insight":
+                return frames, messages
+
+
+def test_messages_carry_consecutive_seq_across_batches_and_runs(connect):
+    with connect(FakeRouter()) as ws:
+        ws.send_text("first")
+        frames, first = _receive_run(ws)
+        ws.send_text('{"query": "second"}')
+        _, second = _receive_run(ws)
+
+    assert any(frame.get("type") == "batch" for frame in frames)
+    assert all("seq" not in frame for frame in frames if frame.get("type") == "batch")
+    messages = first + second
+    assert [m["seq"] for m in messages] == list(range(len(messages)))
+    assert [m["type"] for m in first[:4]] == ["routing_decision", "status", "status", "status"]
+    assert second[-1]["insight"] == "answer to second"
+
+
+def test_unencodable_chunk_becomes_error_and_connection_continues(connect):
+    router = FakeRouter(extra_chunks=[{"type": "reasoning_summary", "step": "generate_queries", "reasoning": 2**70}])
+    with connect(router) as ws:
+        ws.send_text("first")
+        _, first = _receive_run(ws)
+        ws.send_text("second")
+        _, second = _receive_run(ws)
+
+    errors = [m for m in first if m["type"] == "error"]
+    assert len(errors) == 1 and errors[0]["step"] == "generate_queries"
+    assert second[-1]["insight"] == "answer to second"
+    messages = first + second
+    assert [m["seq"] for m in messages] == list(range(len(messages)))
+
+
+def test_missing_components_sends_error_and_closes(monkeypatch):
+    monkeypatch.setitem(main.app_state, "components", None)
+    with TestClient(main.app).websocket_connect("/api/v1/chat/stream") as ws:
+        assert orjson.loads(ws.receive_text())["type"] == "error"
@@ -0,0 +1,42 @@
+from langchain_arch.utils import cache
+from langchain_arch.utils.cache import ResponseCache, make_cache_key, normalize_query
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    responses = ResponseCache(max_entries=4, ttl_seconds=10)
+    responses.set("k", {"queries": []})
+    clock.now += 10
+    assert responses.get("k") == {"queries": []}
+    clock.now += 0.001
+    assert responses.get("k") is None
+    assert len(responses) == 0
+    assert (responses.hits, responses.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    responses = ResponseCache(max_entries=2, ttl_seconds=60)
+    responses.set("a", 1)
+    responses.set("b", 2)
+    assert responses.get("a") == 1 # "b" is now least recently used
+    responses.set("c", 3)
+    assert responses.get("b") is None
+    assert (responses.get("a"), responses.get("c")) == (1, 3)
+    assert len(responses) == 2
+
+
+def test_normalized_queries_share_a_key():
+    assert normalize_query("  Top   Campaigns\tby\nSPEND ") == "top campaigns by spend"
+    assert make_cache_key(normalize_query("Top campaigns"), "schema.md") == make_cache_key(normalize_query(" top  CAMPAIGNS"), "schema.md")
+    assert make_cache_key(normalize_query("Top campaigns"), "schema.md") != make_cache_key(normalize_query("Top campaigns"), "other.md")
+    # Parts are separated, so shifting text between them changes the key
+    assert make_cache_key("ab", "c") != make_cache_key("a", "bc")
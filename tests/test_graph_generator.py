@@ -0,0 +1,43 @@
+import asyncio
+
+from langchain_arch.agents.graph_generator import GraphGeneratorAgent
+from conftest import FakeChain
+
+
+def _agent():
+    agent = GraphGeneratorAgent()
+    agent.chain = FakeChain(lambda inputs: {"graph_suggestions": [{"type": "bar", "x": "name", "y": "clicks"}]})
+    return agent
+
+
+def _input(rows, query="Top campaigns by clicks", columns=("name", "clicks")):
+    return {"query": query, "data": [{"objective": "Top campaigns", "query": "MATCH ...", "data": [dict.fromkeys(columns, n) for n in range(rows)]}]}
+
+
+def test_same_query_and_result_shape_hits_cache():
+    agent = _agent()
+    first = asyncio.run(agent.suggest(_input(3)))
+    # Different row values and count (both "many"), differently spaced query: same shape
+    second = asyncio.run(agent.suggest(_input(5, query="  top campaigns BY clicks")))
+    assert second == first
+    assert len(agent.chain.calls) == 1
+
+
+def test_changed_columns_or_row_count_misses_cache():
+    agent = _agent()
+    asyncio.run(agent.suggest(_input(3)))
+    asyncio.run(agent.suggest(_input(3, columns=("name", "cost"))))
+    asyncio.run(agent.suggest(_input(1)))
+    asyncio.run(agent.suggest(_input(0)))
+    assert len(agent.chain.calls) == 4
+
+
+def test_callers_cannot_mutate_cached_suggestions():
+    agent = _agent()
+    first = asyncio.run(agent.suggest(_input(3)))
+    first["graph_suggestions"][0]["type"] = "pie"
+    second = asyncio.run(agent.suggest(_input(3)))
+    assert second["graph_suggestions"][0]["type"] == "bar"
+    second["graph_suggestions"].clear()
+    assert asyncio.run(agent.suggest(_input(3)))["graph_suggestions"][0]["type"] == "bar"
+    assert len(agent.chain.calls) == 1
@@ -0,0 +1,60 @@
+import asyncio
+
+from langchain_core.exceptions import OutputParserException
+
+from langchain_arch.chains.insight_query_batcher import InsightQueryBatcher
+from conftest import FakeAgent, FakeChain
+
+
+def _agent(batch_respond):
+    single_chain = FakeChain(lambda inputs: {"queries": [f"single: {inputs['query']}"], "reasoning": "r"})
+    return FakeAgent(chain=single_chain, batch_chain=FakeChain(batch_respond))
+
+
+def _echo_batch(inputs):
+    lines = inputs["queries"].splitlines()
+    return {"results": [{"id": i, "queries": [line.split(". ", 1)[1]], "reasoning": "r"} for i, line in enumerate(lines, 1)]}
+
+
+def _submit_all(agent, queries, schema="schema", max_batch_size=8):
+    async def scenario():
+        batcher = InsightQueryBatcher(agent, max_batch_size=max_batch_size, max_wait=0.05, max_concurrency=2)
+        return await asyncio.gather(*(batcher.submit(q, schema) for q in queries), return_exceptions=True)
+    return asyncio.run(scenario())
+
+
+def test_concurrent_submits_share_one_batch_call():
+    agent = _agent(_echo_batch)
+    results = _submit_all(agent, ["q1", "q2", "q3"])
+    assert [r["queries"] for r in results] == [["q1"], ["q2"], ["q3"]]
+    assert len(agent.batch_chain.calls) == 1
+    assert agent.batch_chain.calls[0]["queries"] == "1. q1\n2. q2\n3. q3"
+    assert agent.chain.calls == []
+
+
+def test_single_submit_uses_the_regular_chain():
+    agent = _agent(_echo_batch)
+    assert _submit_all(agent, ["only"])[0]["queries"] == ["single: only"]
+    assert agent.batch_chain.calls == []
+
+
+def test_missing_result_fails_only_that_caller():
+    agent = _agent(lambda inputs: {"results": [{"id": 2, "queries": ["q2"]}]})
+    first, second = _submit_all(agent, ["q1", "q2"])
+    assert isinstance(first, OutputParserException)
+    assert second == {"queries": ["q2"], "reasoning": "N/A"}
+
+
+def test_batch_failure_fans_out_to_every_caller():
+    def fail(inputs):
+        raise RuntimeError("rate limited")
+
+    results = _submit_all(_agent(fail), ["q1", "q2", "q3"])
+    assert all(isinstance(r, RuntimeError) and str(r) == "rate limited" for r in results)
+
+
+def test_max_batch_size_splits_batches():
+    agent = _agent(_echo_batch)
+    results = _submit_all(agent, ["q1", "q2", "q3", "q4"], max_batch_size=2)
+    assert [r["queries"] for r in results] == [["q1"], ["q2"], ["q3"], ["q4"]]
+    assert len(agent.batch_chain.calls) == 2
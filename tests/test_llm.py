@@ -0,0 +1,10 @@
+from langchain_arch.utils import llm
+
+
+def test_llms_get_their_own_client_unless_sharing_is_enabled(monkeypatch):
+    monkeypatch.setattr(llm, "_share_http_async_client", False)
+    assert llm.make_chat_llm(model="gpt-4o").http_async_client is None
+
+    monkeypatch.setattr(llm, "_share_http_async_client", True)
+    first, second = llm.make_chat_llm(model="gpt-4o"), llm.make_chat_llm(model="gpt-4o-mini")
+    assert first.http_async_client is second.http_async_client is llm.get_shared_http_async_client()
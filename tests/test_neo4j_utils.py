@@ -0,0 +1,77 @@
+import pytest
+
+from langchain_arch.utils import neo4j_utils
+from conftest import FakeRecord
+
+
+class FakeSession:
+    def __init__(self, driver):
+        self.driver = driver
+        self.closed = False
+
+    def run(self, query, params):
+        if self.driver.fail:
+            raise RuntimeError("connection reset")
+        return [FakeRecord({"query": query, **params})]
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeDriver:
+    def __init__(self):
+        self.sessions = []
+        self.closed = False
+        self.fail = False
+
+    def verify_connectivity(self):
+        pass
+
+    def session(self, database=None):
+        session = FakeSession(self)
+        self.sessions.append(session)
+        return session
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_driver(monkeypatch):
+    driver = FakeDriver()
+    monkeypatch.setattr(neo4j_utils.GraphDatabase, "driver", lambda uri, auth: driver)
+    neo4j_utils.get_database.cache_clear()
+    yield driver
+    neo4j_utils.get_database.cache_clear()
+
+
+def test_close_database_closes_shared_driver(fake_driver):
+    db = neo4j_utils.get_database()
+    assert neo4j_utils.get_database() is db
+    neo4j_utils.close_database()
+    assert fake_driver.closed
+    assert neo4j_utils.get_database.cache_info().currsize == 0
+    neo4j_utils.close_database() # Safe to call again
+
+
+def test_query_uses_a_session_per_call_and_closes_it(fake_driver):
+    db = neo4j_utils.Neo4jDatabase()
+    assert db.query("RETURN $x AS x", {"x": 1}) == [{"query": "RETURN $x AS x", "x": 1}]
+    assert db.query("RETURN 2") == [{"query": "RETURN 2"}]
+    assert len(fake_driver.sessions) == 2
+    assert all(session.closed for session in fake_driver.sessions)
+
+
+def test_failed_query_closes_its_session(fake_driver):
+    db = neo4j_utils.Neo4jDatabase()
+    fake_driver.fail = True
+    assert db.query("RETURN 1") == []
+    fake_driver.fail = False
+    assert db.query("RETURN 1") == [{"query": "RETURN 1"}]
+    assert [session.closed for session in fake_driver.sessions] == [True, True]
@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+from langchain_core.exceptions import OutputParserException
+from langchain_core.outputs import Generation
+
+from langchain_arch.chains.insight_workflow import InsightWorkflow
+from langchain_arch.utils.output_parsers import FastJsonOutputParser
+from conftest import FakeAgent, FakeChain
+
+
+def test_final_parse_uses_orjson_and_checks_required_keys():
+    parser = FastJsonOutputParser(required_list_keys=("queries",))
+    assert parser.parse_result([Generation(text='{"queries": ["MATCH (n) RETURN n"]}')]) == {"queries": ["MATCH (n) RETURN n"]}
+    # Non-bare JSON falls back to the base parser
+    assert parser.parse_result([Generation(text='```json\n{"queries": []}\n```')]) == {"queries": []}
+    with pytest.raises(OutputParserException):
+        parser.parse_result([Generation(text='{"queries": "MATCH (n) RETURN n"}')])
+
+
+def test_partial_parse_skips_required_keys():
+    parser = FastJsonOutputParser(required_list_keys=("queries",))
+    assert parser.parse_result([Generation(text='{"reas')], partial=True) == {}
+
+
+def test_workflow_rejects_streamed_output_without_queries_list():
+    workflow = InsightWorkflow(None, "schema.md", schema_text="(:Campaign)")
+    workflow.insight_query_gen_agent = FakeAgent(chain=FakeChain(partials=[{}, {"reasoning": "x"}, {"reasoning": "x", "queries": "MATCH (n) RETURN n"}]))
+
+    async def collect():
+        return [event async for event in workflow.run("Which campaigns have the highest spend?") if isinstance(event, dict)]
+
+    events = asyncio.run(collect())
+    errors = [e for e in events if e.get("type") == "error"]
+    assert errors and errors[0]["step"] == "generate_queries"
+    assert "Failed to parse query generator output" in errors[0]["message"]
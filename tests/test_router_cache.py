@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from langchain_arch.chains import router as router_module
+from langchain_arch.utils.cache import ResponseCache
+from conftest import FakeChain
+
+
+class FakeClassifierAgent:
+    def __init__(self):
+        self.chain = FakeChain(lambda inputs: {"workflow": "insight", "reasoning": "test"})
+
+
+class FakeWorkflow:
+    runs = 0
+
+    def __init__(self, neo4j_db, schema_file, schema_text=None):
+        self.schema_file = schema_file
+
+    async def run(self, user_query):
+        FakeWorkflow.runs += 1
+        yield {"type": "final_insight", "insight": f"{self.schema_file}: {user_query}"}
+
+
+@pytest.fixture
+def make_router(monkeypatch):
+    FakeWorkflow.runs = 0
+    monkeypatch.setattr(router_module, "ClassifierAgent", FakeClassifierAgent)
+    monkeypatch.setattr(router_module, "WORKFLOW_CLASSES", {"insight": FakeWorkflow})
+    monkeypatch.setattr(router_module, "get_database", object)
+    return router_module.Router
+
+
+def _run(router, query, workflow_type=None):
+    async def collect():
+        return [chunk async for chunk in router.run(query, workflow_type)]
+    return asyncio.run(collect())
+
+
+def test_normalized_repeat_replays_cached_stream(make_router):
+    router = make_router(schema_file="schema.md")
+    first = _run(router, "Top campaigns by spend")
+    assert _run(router, "  top CAMPAIGNS   by spend ") == first
+    assert FakeWorkflow.runs == 1
+    assert len(router.classifier.chain.calls) == 1
+    assert router.cache_stats()["response_hits"] == 1
+
+
+def test_classifier_cache_is_keyed_by_normalized_query(make_router):
+    router = make_router(schema_file="schema.md")
+    asyncio.run(router._classify("Top campaigns"))
+    asyncio.run(router._classify("top   campaigns "))
+    asyncio.run(router._classify("Worst campaigns"))
+    assert len(router.classifier.chain.calls) == 2
+
+
+def test_schema_file_change_misses_response_cache(make_router):
+    shared = ResponseCache()
+    router = make_router(schema_file="schema.md", response_cache=shared)
+    _run(router, "Top campaigns")
+    other = make_router(schema_file="schema_v2.md", response_cache=shared)
+    chunks = _run(other, "Top campaigns")
+    assert FakeWorkflow.runs == 2
+    assert chunks[-1]["insight"] == "schema_v2.md: Top campaigns"
+
+    # Same router pointed at a new schema file no longer hits the old entry either
+    router.schema_file = "schema_v2.md"
+    _run(router, "Top campaigns")
+    assert FakeWorkflow.runs == 2 # Served from the schema_v2 entry
+    router.schema_file = "schema_v3.md"
+    _run(router, "Top campaigns")
+    assert FakeWorkflow.runs == 3
+
+
+def test_closing_one_router_leaves_shared_database_open(make_router, monkeypatch):
+    closed = []
+    monkeypatch.setattr(router_module, "close_database", lambda: closed.append(True))
+    first, second = make_router(), make_router()
+    first.warm_up()
+    second.warm_up()
+    first.close()
+    assert closed == []
+    assert first._db_connection is None and first._workflows == {}
+    assert second._db_connection is not None
+    assert _run(second, "Top campaigns")[-1]["type"] == "final_insight"
+
+
+def test_trivial_query_skips_classifier(make_router):
+    router = make_router(schema_file="schema.md")
+    chunks = _run(router, "Thanks!")
+    assert len(router.classifier.chain.calls) == 0
+    assert {"type": "routing_decision", "workflow_type": "insight"} in chunks
+    assert chunks[-1]["type"] == "final_insight"
+    _run(router, "Top campaigns by spend")
+    assert len(router.classifier.chain.calls) == 1
@@ -0,0 +1,14 @@
+import orjson
+from neo4j.time import Date
+
+from langchain_arch.utils.serialization import dumps_prompt_data, prompt_data
+
+
+def test_dumps_prompt_data_encodes_nested_neo4j_temporals():
+    data = {"Top campaigns": [{"campaign": {"name": "A", "start": Date(2024, 1, 31)}}]}
+    assert orjson.loads(dumps_prompt_data(data)) == {"Top campaigns": [{"campaign": {"name": "A", "start": "2024-01-31"}}]}
+
+
+def test_prompt_data_prefers_pre_serialized_json():
+    assert prompt_data({"data": [1], "data_json": "[2]"}) == "[2]"
+    assert orjson.loads(prompt_data({"data": [1]})) == [1]